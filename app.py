@@ -1,23 +1,72 @@
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, send_from_directory
-from dotcoder_agent import DotCoderAgent
-from dotcoder.chat_enhancer import ChatEnhancer
+from flask import Flask, request, jsonify, render_template, session, redirect, url_for, send_from_directory, Response, stream_with_context, g
+from dotcoder_agent import DotCoderAgent, DotCoderAgentStream, chat_enhancer
 from dotcoder.dotcoder_auth import DotCoderAuth
+from dotcoder.conversation_store import ConversationNotFound, create_conversation_store
+from dotcoder.live_files import get_live_project, select_encoding, variant_etag, versioned_url
+from dotcoder.avatar_images import AvatarError, MAX_AVATAR_BYTES, avatar_url, check_avatar
 from datetime import timedelta
 from datetime import datetime
 import os
+import json
 import base64
-import time
-import requests
+from dotcoder.http_client import get_session
+from dotcoder import request_memo, metrics, tracing
+from dotcoder.lazy import LazyObject
 
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY")
 app.permanent_session_lifetime = timedelta(days=30)
 
-chat_enhancer = ChatEnhancer()
-auth = DotCoderAuth()
+# Built on first use, so a worker starts without Firebase and Gemini being set up.
+auth = LazyObject(DotCoderAuth)
+# Opening the store creates its SQLite file, so that waits for the first chat request too.
+conversation_store = LazyObject(lambda: create_conversation_store(database=lambda: auth.db))
+
+metrics.register("token_cache", lambda: auth.token_cache.stats() if auth.lazy_initialized else None)
+metrics.register("gallery_cache", lambda: auth.gallery_cache.stats() if auth.lazy_initialized else None)
+metrics.register("avatar", lambda: auth.avatar_stats() if auth.lazy_initialized else None)
 
 # **************** Functions ***************
 
+# Every request is a span named after its route, Firebase, Gemini and tool spans below it show where the time went.
+# A streamed response ends its span when the stream is done.
+@app.before_request
+def begin_request_span():
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.request_span = tracing.start_span(
+        f"{request.method} {route}",
+        kind="server",
+        traceparent=request.headers.get('traceparent'),
+        **{"http.method": request.method, "http.route": route}
+    )
+    g.request_span_token = tracing.activate(g.request_span)
+
+@app.after_request
+def record_response_status(response):
+    span = g.get('request_span')
+    if span is not None:
+        span.set(**{"http.status_code": response.status_code})
+        if response.status_code >= 500:
+            span.fail(f"HTTP {response.status_code}")
+        response.headers['X-Trace-ID'] = span.trace_id
+    return response
+
+@app.teardown_request
+def end_request_span(exception=None):
+    span = g.pop('request_span', None)
+    if span is not None:
+        tracing.deactivate(g.pop('request_span_token'))
+        span.end(exception)
+
+# Account info and user records are read at most once per request.
+@app.before_request
+def begin_request_memo():
+    request_memo.begin()
+
+@app.teardown_request
+def end_request_memo(exception=None):
+    request_memo.end()
+
 def get_valid_token():
     id_token = session.get('idToken', None)
     refresh_token = session.get('refresh_token', None)
@@ -31,7 +80,6 @@ def get_valid_token():
                 session.permanent = True
                 session['idToken'] = refresh_user["idToken"]
                 session["refresh_token"] = refresh_user["refreshToken"]
-                time.sleep(2)
                 return refresh_user["idToken"]
             else:
                 return None
@@ -44,12 +92,66 @@ def verify_recaptcha(response_token):
         'secret': secret_key,
         'response': response_token
     }
-    r = requests.post('https://www.google.com/recaptcha/api/siteverify', data=payload)
+    r = get_session().post('https://www.google.com/recaptcha/api/siteverify', data=payload)
     result = r.json()
     return result.get('success', False)
 
+def get_chat_history(token, form):
+    """
+    Returns (chat_history, conversation) for a chat request.
+    Old clients post the whole history as `messages` and get conversation None, new clients
+    send a `conversation_id` (empty on the first turn) and the history is loaded from the store.
+    Raises ConversationNotFound for a `conversation_id` the store does not have (evicted, or kept by
+    another process), unless the client resends its turns as `history` to restore it.
+    """
+    messages = form.getlist('messages')
+    conversation_id = form.get('conversation_id')
+
+    if messages and not conversation_id:
+        return messages, None
+
+    owner = auth.account_info(token)["users"][0]["localId"]
+    if not conversation_id:
+        return [], (owner, conversation_store.new_conversation_id())
+
+    turns = conversation_store.load(owner, conversation_id, token=token)
+    if turns is None:
+        turns = parse_history(form.get('history'))
+        if not turns:
+            raise ConversationNotFound(conversation_id)
+        conversation_store.append(owner, conversation_id, turns, token=token)
+    return [(turn["role"], turn["content"]) for turn in turns], (owner, conversation_id)
+
+def parse_history(history):
+    """Returns the {"role", "content"} turns of a JSON `history` field, dropping anything else."""
+    try:
+        turns = json.loads(history) if history else []
+    except ValueError:
+        return []
+    if not isinstance(turns, list):
+        return []
+    return [
+        {"role": turn["role"], "content": turn["content"]}
+        for turn in turns
+        if isinstance(turn, dict) and turn.get("role") in ("user", "assistant") and isinstance(turn.get("content"), str)
+    ]
+
+CONVERSATION_NOT_FOUND = 'This conversation is no longer available. Resend its history or start a new conversation.'
+
+def save_chat_turns(token, conversation, query, ai_response):
+    if conversation is None:
+        return
+    owner, conversation_id = conversation
+    conversation_store.append(owner, conversation_id, [
+        {"role": "user", "content": query},
+        {"role": "assistant", "content": ai_response}
+    ], token=token)
+
 
     
+app.add_template_global(avatar_url, 'avatar_url')
+app.add_template_global(versioned_url, 'versioned_url')
+
 @app.template_filter('time_ago')
 def time_ago(time_string):
     """
@@ -85,15 +187,44 @@ def terms_conditions():
     
 # **************** Project Gallery End point ***************
 
+def get_page_size():
+    try:
+        page_size = int(request.args.get('page_size', 24))
+    except ValueError:
+        page_size = 24
+    return max(1, min(page_size, 100))
+
 @app.route("/live-projects")
 def all_project_projects():
     token = get_valid_token()
     if token is None:
         return redirect(url_for("sign_in"))
     
-    live_projects_data = auth.get_all_live_projects_data(token)
+    page_size = get_page_size()
+    page = auth.get_live_projects_page(token, page_size=page_size, cursor=request.args.get('cursor')) or {}
+    live_projects_data = {project["key"]: project for project in page.get("projects", [])}
+
+    return render_template(
+        'all_live_projects.html',
+        live_projects_data=live_projects_data,
+        next_cursor=page.get("next_cursor"),
+        page_size=page_size
+    )
+
+@app.route("/api/live-projects")
+def live_projects_api():
+    token = get_valid_token()
+    if token is None:
+        return jsonify({'error': 'You are not authentic user. Try again'}), 401
 
-    return render_template('all_live_projects.html', live_projects_data=live_projects_data)
+    page = auth.get_live_projects_page(token, page_size=get_page_size(), cursor=request.args.get('cursor'))
+    if page is None:
+        return jsonify({'error': 'Failed to load live projects'}), 500
+    for project in page["projects"]:
+        project["avatar_url"] = avatar_url(project.get("profile_picture"), 40)
+        project["avatar_url_2x"] = avatar_url(project.get("profile_picture"), 80)
+        project["versioned_url"] = versioned_url(project)
+    return jsonify(page)
 
 
 # **************** Page Not Found End point ***************
@@ -145,12 +276,30 @@ def dashboard():
 @app.route('/live/<path:url_path>')
 def view_live_project(url_path):
     if url_path:
-        file_path = f"static/live_projects/{url_path}.html"
+        live_project = get_live_project(url_path, os.path.join(app.root_path, 'static', 'live_projects'))
         
-        if os.path.exists(file_path):
-            directory = os.path.join(app.root_path, 'static', 'live_projects')
-            filename = f"{url_path}.html"
-            return send_from_directory(directory, filename)
+        if live_project is not None:
+            etag = live_project["etag"]
+            encoding = select_encoding(live_project["variants"], request.accept_encodings)
+
+            # Dashboard and gallery link to `?v=<etag>` (see versioned_url), a URL carrying the current version never
+            # changes. The plain URL, which is the one users share, is revalidated so a republish shows up.
+            if request.args.get('v') == etag:
+                cache_control = 'public, max-age=31536000, immutable'
+            else:
+                cache_control = 'public, no-cache'
+
+            if request.if_none_match.contains(variant_etag(etag, encoding)):
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(live_project["variants"][encoding], mimetype='text/html')
+                if encoding:
+                    response.headers['Content-Encoding'] = encoding
+
+            response.set_etag(variant_etag(etag, encoding))
+            response.headers['Cache-Control'] = cache_control
+            response.headers['Vary'] = 'Accept-Encoding'
+            return response
         else:
             return jsonify({"message": f"No project found on this address {url_path}"}), 404
         
@@ -237,7 +386,8 @@ def make_project_live():
             project_url=project_url,
             username=user_data.get("local_id_data", {}).get("username"),
             code=code,
-            description=description
+            description=description,
+            profile_picture=user_data.get("local_id_data", {}).get("profile_picture")
         )
 
         if is_created:
@@ -256,21 +406,32 @@ def update_profile():
     if id_token is None:
         return redirect(url_for("sign_in"))
 
+    # The size cap is checked on the request body, so an oversized upload is neither parsed nor decoded.
+    if request.content_length is not None and request.content_length > MAX_AVATAR_BYTES * 4 // 3 + 64 * 1024:
+        return jsonify({'error': 'The avatar is too large'}), 413
+
     data = request.get_json()
     avatar = data.get('avatar')
 
     if avatar:
+        # Base64 is 4/3 of the decoded size, oversized uploads are refused before decoding.
+        if len(avatar) > MAX_AVATAR_BYTES * 4 // 3 + 1024:
+            return jsonify({'error': 'The avatar is too large'}), 413
         try:
             image_data = base64.b64decode(avatar.split(',')[1])
         except Exception as e:
             return jsonify({'error': 'Invalid avatar data'}), 400
+        try:
+            check_avatar(image_data)
+        except AvatarError as e:
+            return jsonify({'error': str(e)}), 400
 
     user_info = auth.update_profile(id_token, data.get('full_name'), image_data if avatar else None)
 
     if user_info:
         return jsonify({'success': True}), 200
     else:
-        return jsonify({'error': 'Failed to retrieve user information'}), 500
+        return jsonify({'error': 'Profile not updated. Please try again.'}), 500
 
 
 # **************** Reset Password Endpoint ***************
@@ -381,6 +542,7 @@ def sign_up_api():
 
 @app.route('/sign-out')
 def sign_out():
+    auth.sign_out(session.get('idToken', None))
     session.clear()
     return redirect(url_for("landing_page"))
     
@@ -431,17 +593,59 @@ def get_data():
         return jsonify({'error': 'You are not authentic user. Try again'}), 500
 
     query = request.form.get('query')
-    messages = request.form.getlist('messages')
     file = request.form.get('file')
 
-    if not query or not messages:
-        return jsonify({'error': 'Query and messages are required'}), 400
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+
+    try:
+        chat_history, conversation = get_chat_history(token, request.form)
+    except ConversationNotFound:
+        return jsonify({'error': CONVERSATION_NOT_FOUND}), 409
 
-    ai_response = DotCoderAgent(query, messages)["output"]
+    agent_response = DotCoderAgent(query, chat_history, request_id=request.headers.get('X-Request-ID'))
+    ai_response = agent_response["output"]
 
     if ai_response is None:
         return jsonify({'error': 'Failed to get response from AI'}), 500
-    return jsonify({'response': ai_response})
+
+    save_chat_turns(token, conversation, query, ai_response)
+
+    from_cache = agent_response.get("from_cache", False)
+    if conversation is None:
+        return jsonify({'response': ai_response, 'from_cache': from_cache})
+    return jsonify({'response': ai_response, 'conversation_id': conversation[1], 'from_cache': from_cache})
+
+
+@app.route('/api/chat-data/stream', methods=['POST'])
+def stream_data():
+    token = get_valid_token()
+    if token is None:
+        return jsonify({'error': 'You are not authentic user. Try again'}), 500
+
+    query = request.form.get('query')
+
+    if not query:
+        return jsonify({'error': 'Query is required'}), 400
+
+    try:
+        chat_history, conversation = get_chat_history(token, request.form)
+    except ConversationNotFound:
+        return jsonify({'error': CONVERSATION_NOT_FOUND}), 409
+
+    def generate():
+        if conversation is not None:
+            yield f"event: conversation\ndata: {json.dumps(conversation[1])}\n\n"
+        for event, data in DotCoderAgentStream(query, chat_history, request_id=request.headers.get('X-Request-ID')):
+            if event == "final":
+                save_chat_turns(token, conversation, query, data)
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 # **************** Chat Enhancer Endpoint ***************
@@ -474,6 +678,17 @@ def enhance_prompt():
     
 
 
+# **************** Metrics Endpoint ***************
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # With METRICS_TOKEN set, scrapers have to send it as a bearer token.
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token and request.headers.get('Authorization') != f"Bearer {metrics_token}":
+        return Response("Unauthorized", status=401)
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 # PWA manifest and service worker routes
 @app.route('/sw.js')
 def service_worker():
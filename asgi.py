@@ -0,0 +1,224 @@
+import json
+import asyncio
+from io import BytesIO
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.wrappers import Request
+
+from app import app as flask_app, auth, chat_enhancer, get_chat_history, save_chat_turns, CONVERSATION_NOT_FOUND
+from dotcoder.conversation_store import ConversationNotFound
+from dotcoder_agent import DotCoderAgentAsync, DotCoderAgentAsyncStream
+from dotcoder.http_client import aclose_async_client
+from dotcoder import tracing
+
+# ASGI entry point, run with `uvicorn asgi:app`.
+# The chat and prompt enhancer endpoints run natively on the event loop, every other
+# route (and any request whose session needs a token refresh) is served by the Flask app.
+
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+# **************** Functions ***************
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+def build_request(scope, body):
+    """Build a werkzeug Request from an ASGI scope so form parsing and the Flask session work as usual."""
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": "asgi",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": BytesIO(body),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value.decode("latin-1")
+        elif key != "CONTENT_LENGTH":
+            environ[f"HTTP_{key}"] = value.decode("latin-1")
+    return Request(environ)
+
+
+async def get_valid_token(request):
+    """Return the session's ID token if it is still valid, None if Flask has to refresh it."""
+    session = flask_app.session_interface.open_session(flask_app, request)
+    id_token = session.get('idToken', None) if session is not None else None
+    if not id_token:
+        return None
+    account_info = await asyncio.to_thread(auth.account_info, id_token)
+    return id_token if account_info is not None else None
+
+
+async def send_json(send, data, status=200):
+    body = json.dumps(data).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_event_stream(send, events):
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+    })
+    async for event, data in events:
+        chunk = f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+# **************** AI Response End Endpoint ***************
+
+async def chat_data(request, send, token):
+    query = request.form.get('query')
+
+    if not query:
+        return await send_json(send, {'error': 'Query is required'}, 400)
+
+    try:
+        chat_history, conversation = await asyncio.to_thread(get_chat_history, token, request.form)
+    except ConversationNotFound:
+        return await send_json(send, {'error': CONVERSATION_NOT_FOUND}, 409)
+
+    agent_response = await DotCoderAgentAsync(query, chat_history, request_id=request.headers.get('X-Request-ID'))
+    ai_response = agent_response["output"]
+
+    if ai_response is None:
+        return await send_json(send, {'error': 'Failed to get response from AI'}, 500)
+
+    await asyncio.to_thread(save_chat_turns, token, conversation, query, ai_response)
+
+    from_cache = agent_response.get("from_cache", False)
+    if conversation is None:
+        return await send_json(send, {'response': ai_response, 'from_cache': from_cache})
+    return await send_json(send, {'response': ai_response, 'conversation_id': conversation[1], 'from_cache': from_cache})
+
+
+async def stream_data(request, send, token):
+    query = request.form.get('query')
+
+    if not query:
+        return await send_json(send, {'error': 'Query is required'}, 400)
+
+    try:
+        chat_history, conversation = await asyncio.to_thread(get_chat_history, token, request.form)
+    except ConversationNotFound:
+        return await send_json(send, {'error': CONVERSATION_NOT_FOUND}, 409)
+
+    async def events():
+        if conversation is not None:
+            yield ("conversation", conversation[1])
+        async for event, data in DotCoderAgentAsyncStream(query, chat_history, request_id=request.headers.get('X-Request-ID')):
+            if event == "final":
+                await asyncio.to_thread(save_chat_turns, token, conversation, query, data)
+            yield (event, data)
+
+    await send_event_stream(send, events())
+
+
+# **************** Chat Enhancer Endpoint ***************
+
+async def enhance_prompt(request, send, token):
+    data = request.get_json(silent=True)
+
+    prompt = data.get('prompt') if isinstance(data, dict) else None
+    conversation = data.get('conversation') if isinstance(data, dict) else []
+
+    if not prompt:
+        return await send_json(send, {'error': 'Prompt is required'}, 400)
+
+    if not isinstance(conversation, list):
+        conversation = []
+
+    enhanced_prompt = await chat_enhancer.aenhance_prompt(prompt, conversation)
+    return await send_json(send, {'enhanced_prompt': enhanced_prompt or ""})
+
+
+async_routes = {
+    "/api/chat-data": chat_data,
+    "/api/chat-data/stream": stream_data,
+    "/api/enhance-prompt": enhance_prompt,
+}
+
+
+# **************** ASGI Application ***************
+
+def traced_send(send, span):
+    """Wrap `send` so the response status and trace id end up on the request span and in the response."""
+    async def send_and_record(message):
+        if message["type"] == "http.response.start":
+            span.set(**{"http.status_code": message["status"]})
+            if message["status"] >= 500:
+                span.fail(f"HTTP {message['status']}")
+            headers = list(message.get("headers", []))
+            # A request handed over to Flask already got the header from its after_request hook.
+            if not any(name.lower() == b"x-trace-id" for name, _ in headers):
+                message = dict(message, headers=headers + [(b"x-trace-id", span.trace_id.encode("ascii"))])
+        await send(message)
+
+    return send_and_record
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aclose_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    handler = async_routes.get(scope.get("path")) if scope["type"] == "http" and scope.get("method") == "POST" else None
+    if handler is None:
+        return await wsgi_app(scope, receive, send)
+
+    body = await read_body(receive)
+    request = build_request(scope, body)
+
+    # Same request span as the Flask hooks create, a request handed over to Flask continues it.
+    with tracing.span(
+        f"POST {scope['path']}",
+        kind="server",
+        traceparent=request.headers.get('traceparent'),
+        **{"http.method": "POST", "http.route": scope["path"]}
+    ) as span:
+        send = traced_send(send, span)
+
+        token = await get_valid_token(request)
+        if token is None:
+            # Let Flask refresh the token (and set the new session cookie) or reject the request.
+            replayed = False
+
+            async def replay_receive():
+                nonlocal replayed
+                if not replayed:
+                    replayed = True
+                    return {"type": "http.request", "body": body, "more_body": False}
+                return await receive()
+
+            return await wsgi_app(scope, replay_receive, send)
+
+        await handler(request, send, token)
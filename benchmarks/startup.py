@@ -0,0 +1,51 @@
+"""
+    Measure how long a fresh worker takes to import the app and answer its first request.
+
+    Usage:
+        python benchmarks/startup.py [--runs 5] [--module app]
+
+    Every run starts a new interpreter in the repository root, so nothing is shared between runs.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import json, time
+started = time.perf_counter()
+import {module} as target
+imported = time.perf_counter()
+with target.app.test_client() as client:
+    client.get("/")
+answered = time.perf_counter()
+print(json.dumps({{"import": imported - started, "first_request": answered - imported}}))
+"""
+
+
+def run_once(module: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", MEASURE.format(module=module)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default="app")
+    args = parser.parse_args()
+
+    runs = [run_once(args.module) for _ in range(args.runs)]
+    for key in ("import", "first_request"):
+        values = [run[key] for run in runs]
+        print(f"{key:>13}: median {statistics.median(values) * 1000:8.1f} ms   min {min(values) * 1000:8.1f} ms   ({args.runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
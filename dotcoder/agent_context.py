@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import uuid
+import logging
+import functools
+import threading
+import contextvars
+
+from dotcoder import metrics, tracing
+
+logger = logging.getLogger("dotcoder.agent")
+
+# The run of the agent the current thread or task is working for, tool threads inherit it.
+_current_run = contextvars.ContextVar("dotcoder_agent_run", default=None)
+
+_totals_lock = threading.Lock()
+_totals = {
+    "runs": 0,
+    "cached_runs": 0,
+    "failed_runs": 0,
+    "llm_calls": 0,
+    "tool_calls": 0,
+    "tool_errors": 0,
+    "prompt_tokens": 0,
+    "output_tokens": 0,
+}
+
+
+def configure_logging(level: str = None):
+    """
+        Send agent logs to stderr as one JSON object per line at AGENT_LOG_LEVEL (default INFO).
+        Applications that configure logging themselves can skip this and attach their own handler.
+    """
+    logger.setLevel((level or os.getenv("AGENT_LOG_LEVEL", "INFO")).upper())
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.propagate = False
+
+
+def current_run():
+    """Return the AgentRunContext of the running agent call, or None."""
+    return _current_run.get()
+
+
+def stats() -> dict:
+    """Counters of every agent run this process has finished."""
+    with _totals_lock:
+        return dict(_totals)
+
+
+class AgentRunContext:
+    def __init__(self, request_id: str = None, name: str = "DotCoderAgent"):
+        """
+            State of one agent call. Nothing in it is shared with other calls, so concurrent chats
+            on threads, tasks or worker processes never touch each other's data.
+
+            Args:
+                request_id (str): Optional id of the HTTP request, logged with every event of the run.
+                name (str): Run name shown in LangChain traces.
+        """
+        self.run_id = uuid.uuid4().hex[:16]
+        self.request_id = request_id
+        self.name = name
+        self.started = time.perf_counter()
+
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.tool_errors = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.from_cache = False
+        self.span = None
+        self._token = None
+        self._span_token = None
+        # Tool callbacks of one step arrive from several threads.
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        # LLM and tool spans of the run are children of this one, which is a child of the request's span.
+        self.span = tracing.start_span("agent.run", run_id=self.run_id, request_id=self.request_id)
+        self._span_token = tracing.activate(self.span)
+        self._token = _current_run.set(self)
+        self.log(logging.INFO, "agent_start")
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc is not None:
+            self.log(logging.ERROR, "agent_error", error=type(exc).__name__, message=str(exc)[:500])
+        self._add_to_totals(failed=exc is not None)
+        self.span.set(
+            llm_calls=self.llm_calls,
+            tool_calls=self.tool_calls,
+            tool_errors=self.tool_errors,
+            prompt_tokens=self.prompt_tokens,
+            output_tokens=self.output_tokens,
+            from_cache=self.from_cache
+        )
+        self.span.end(exc)
+        tracing.deactivate(self._span_token)
+        try:
+            _current_run.reset(self._token)
+        except ValueError:
+            # A stream closed from another context (e.g. a dropped client), the variable dies with that context.
+            pass
+        return False
+
+    def count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _add_to_totals(self, failed: bool):
+        with _totals_lock:
+            _totals["runs"] += 1
+            _totals["cached_runs"] += int(self.from_cache)
+            _totals["failed_runs"] += int(failed)
+            for counter in ("llm_calls", "tool_calls", "tool_errors", "prompt_tokens", "output_tokens"):
+                _totals[counter] += getattr(self, counter)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def finish(self, from_cache: bool = False):
+        self.from_cache = from_cache
+        self.log(
+            logging.INFO, "agent_end",
+            duration_ms=round(self.elapsed() * 1000, 1),
+            llm_calls=self.llm_calls,
+            tool_calls=self.tool_calls,
+            tool_errors=self.tool_errors,
+            prompt_tokens=self.prompt_tokens,
+            output_tokens=self.output_tokens,
+            from_cache=from_cache
+        )
+
+    def log(self, level: int, event: str, **fields):
+        if not logger.isEnabledFor(level):
+            return
+        record = {"event": event, "run_id": self.run_id}
+        if self.span is not None:
+            record["trace_id"] = self.span.trace_id
+        if self.request_id:
+            record["request_id"] = self.request_id
+        record.update(fields)
+        logger.log(level, json.dumps(record, default=str))
+
+    def config(self, callbacks: list = None) -> dict:
+        """LangChain run config of this call, with the logging handler in front of `callbacks`."""
+        return {
+            "callbacks": [_log_handler_class()(self)] + list(callbacks or []),
+            "run_name": self.name,
+            "metadata": {"dotcoder_run_id": self.run_id, "request_id": self.request_id},
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def _log_handler_class():
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class AgentLogHandler(BaseCallbackHandler):
+        """
+            Log LLM and tool events of one run as structured records, never the prompt or scratchpad,
+            and time each LLM call as a span with its token usage.
+        """
+
+        def __init__(self, context: AgentRunContext):
+            self.context = context
+            self._tool_started = {}
+            self._llm_spans = {}
+
+        def _start_llm_span(self, run_id, kwargs):
+            model = (kwargs.get("metadata") or {}).get("ls_model_name") or (kwargs.get("invocation_params") or {}).get("model")
+            self._llm_spans[run_id] = tracing.start_span("llm.call", parent=self.context.span, kind="client", model=model)
+
+        def on_chat_model_start(self, serialized, messages, run_id=None, **kwargs):
+            self._start_llm_span(run_id, kwargs)
+
+        def on_llm_start(self, serialized, prompts, run_id=None, **kwargs):
+            self._start_llm_span(run_id, kwargs)
+
+        def on_llm_end(self, response, run_id=None, **kwargs):
+            self.context.count("llm_calls")
+            usage = [
+                getattr(getattr(generation, "message", None), "usage_metadata", None)
+                for generations in response.generations for generation in generations
+            ]
+            usage = [item for item in usage if item]
+            prompt_tokens = sum(item.get("input_tokens", 0) for item in usage)
+            output_tokens = sum(item.get("output_tokens", 0) for item in usage)
+            self.context.count("prompt_tokens", prompt_tokens)
+            self.context.count("output_tokens", output_tokens)
+
+            span = self._llm_spans.pop(run_id, None)
+            if span is not None:
+                span.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+                span.end()
+            self.context.log(logging.DEBUG, "llm_end", usage=usage)
+
+        def on_llm_error(self, error, run_id=None, **kwargs):
+            span = self._llm_spans.pop(run_id, None)
+            if span is not None:
+                span.end(error)
+
+        def on_tool_start(self, serialized, input_str, run_id=None, **kwargs):
+            self.context.count("tool_calls")
+            self._tool_started[run_id] = time.perf_counter()
+            self.context.log(logging.DEBUG, "tool_start", tool=(serialized or {}).get("name"), input_chars=len(input_str or ""))
+
+        def on_tool_end(self, output, run_id=None, **kwargs):
+            started = self._tool_started.pop(run_id, None)
+            self.context.log(
+                logging.INFO, "tool_end",
+                tool=kwargs.get("name"),
+                duration_ms=round((time.perf_counter() - started) * 1000, 1) if started else None,
+                output_chars=len(str(output))
+            )
+
+        def on_tool_error(self, error, run_id=None, **kwargs):
+            self.context.count("tool_errors")
+            self._tool_started.pop(run_id, None)
+            self.context.log(logging.WARNING, "tool_error", tool=kwargs.get("name"), error=type(error).__name__, message=str(error)[:500])
+
+    return AgentLogHandler
+
+
+metrics.register("agent", stats)
@@ -0,0 +1,21 @@
+import os
+import uuid
+
+
+def write_atomic(path: str, data: bytes):
+    """
+        Replace `path` with `data` in one step, readers see the old file or the new one, never a partial write.
+        Every call writes its own uniquely named temp file, so concurrent writers of the same path (threads or
+        processes) never collide, and the file gets the usual umask permissions.
+    """
+    temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temp_path, "xb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,128 @@
+import io
+import os
+import re
+import hashlib
+
+from dotcoder.atomic_files import write_atomic
+
+AVATAR_DIRECTORY = "static/profile/profile_image"
+AVATAR_URL_PREFIX = "http://127.0.0.1:5000/static/profile/profile_image"
+
+# Square edges in pixels: 40 for gallery cards and the dashboard header, 128 for the dashboard,
+# 80 and 256 for the same places on high-density screens.
+THUMBNAIL_SIZES = (40, 80, 128, 256)
+
+ALLOWED_FORMATS = {"PNG", "JPEG", "WEBP", "GIF"}
+MAX_AVATAR_BYTES = int(os.getenv("AVATAR_MAX_BYTES", 5 * 1024 * 1024))
+# Larger images are refused before any pixel is decoded.
+MAX_AVATAR_PIXELS = int(os.getenv("AVATAR_MAX_PIXELS", 4096 * 4096))
+
+_THUMBNAIL_URL = re.compile(r"^(?P<prefix>.*/[0-9a-f]{64})-(?P<size>\d+)\.(?P<extension>webp|png)$")
+
+
+class AvatarError(ValueError):
+    pass
+
+
+def _image_module():
+    from PIL import Image
+    return Image
+
+
+def _extension() -> str:
+    from PIL import features
+    return "webp" if features.check("webp") else "png"
+
+
+def avatar_id(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def thumbnail_name(image_id: str, size: int, extension: str = None) -> str:
+    return f"{image_id}-{size}.{extension or _extension()}"
+
+
+def check_avatar(data: bytes):
+    """
+        Validate an uploaded avatar from its header only.
+
+        Returns:
+            (format, width, height) of the image.
+
+        Raises:
+            AvatarError: If the upload is too large, not an image, or in an unsupported format.
+    """
+    if not data:
+        raise AvatarError("The avatar is empty.")
+    if len(data) > MAX_AVATAR_BYTES:
+        raise AvatarError(f"The avatar must be smaller than {MAX_AVATAR_BYTES // (1024 * 1024)} MB.")
+
+    Image = _image_module()
+    try:
+        # Image.open only parses the header, pixels are decoded later by load().
+        with Image.open(io.BytesIO(data)) as image:
+            image_format, (width, height) = image.format, image.size
+    except Exception:
+        raise AvatarError("The avatar is not a valid image.")
+
+    if image_format not in ALLOWED_FORMATS:
+        raise AvatarError("The avatar must be a PNG, JPEG, WebP or GIF image.")
+    if width * height > MAX_AVATAR_PIXELS:
+        raise AvatarError("The avatar dimensions are too large.")
+    return image_format, width, height
+
+
+def process_avatar(data: bytes, directory: str = AVATAR_DIRECTORY) -> str:
+    """
+        Write the square thumbnails of an uploaded avatar as `<sha256>-<size>.<webp|png>`.
+        Identical uploads share their files, so an existing set is reused as-is.
+
+        Returns:
+            The URL of the largest thumbnail, pass it through `avatar_url` to pick a smaller one.
+    """
+    check_avatar(data)
+    Image = _image_module()
+    from PIL import ImageOps
+
+    image_id = avatar_id(data)
+    extension = _extension()
+    largest = max(THUMBNAIL_SIZES)
+    url = f"{AVATAR_URL_PREFIX}/{thumbnail_name(image_id, largest, extension)}"
+
+    os.makedirs(directory, exist_ok=True)
+    if all(os.path.exists(os.path.join(directory, thumbnail_name(image_id, size, extension))) for size in THUMBNAIL_SIZES):
+        return url
+
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs are decoded at a reduced scale straight away when the source is much larger than needed.
+        image.draft("RGB", (largest * 2, largest * 2))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+        thumbnail = ImageOps.fit(image, (largest, largest), Image.LANCZOS)
+
+    # Each size is scaled down from the previous one instead of the full image.
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        if thumbnail.size[0] != size:
+            thumbnail = thumbnail.resize((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if extension == "webp":
+            thumbnail.save(buffer, "WEBP", quality=85, method=4)
+        else:
+            thumbnail.save(buffer, "PNG", optimize=True)
+        write_atomic(os.path.join(directory, thumbnail_name(image_id, size, extension)), buffer.getvalue())
+
+    return url
+
+
+def avatar_url(url: str, size: int) -> str:
+    """
+        Return the smallest thumbnail of `url` that is at least `size` pixels wide.
+        URLs that are not processed thumbnails (the default avatar, older uploads) are returned unchanged.
+    """
+    match = _THUMBNAIL_URL.match(url or "")
+    if match is None:
+        return url
+
+    fitting = [thumbnail_size for thumbnail_size in THUMBNAIL_SIZES if thumbnail_size >= size]
+    best = min(fitting) if fitting else max(THUMBNAIL_SIZES)
+    return f"{match['prefix']}-{best}.{match['extension']}"
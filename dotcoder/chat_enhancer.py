@@ -1,6 +1,19 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dotcoder import tracing
+from dotcoder.summary_cache import SummaryCache
+from dotcoder.single_flight import SingleFlight
+
+# New turns up to this many characters are passed to the enhancement as they are instead of waiting for a summary.
+ENHANCE_INLINE_CHARS = int(os.getenv("ENHANCE_INLINE_CHARS", 4000))
+
+
 class ChatEnhancer:
     def __init__(self, GEMINI_API_KEY=None):
-        import os
         import google.generativeai as genai
 
         self.GEMINI_API_KEY = GEMINI_API_KEY or os.getenv("GEMINI_API_KEY")
@@ -11,36 +24,174 @@ class ChatEnhancer:
         genai.configure(api_key=self.GEMINI_API_KEY)
         self.genai = genai
 
+        self.summary_cache = SummaryCache(max_entries=int(os.getenv("SUMMARY_CACHE_SIZE", 1000)))
+        self._summary_flight = SingleFlight(result_ttl=0)
+        # Summaries that only warm the cache for the next enhancement run here.
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._background_tasks = set()
+
+        # GenerativeModel instances are built once per (model, temperature, max tokens) and reused.
+        self._models = {}
+        self._models_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._call_stats = {}
+
     # ********** Gemini AI Interaction **********
 
     def _gemini_ai(self, messages: list, model: str = "gemini-1.5-flash", token: int = 6000, temperature: float = 0.7) -> str:
-        prompt = ""
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            prompt += f"{role.capitalize()}: {content}\n"
-
-        try:
-            model_obj = self.genai.GenerativeModel(
-                model_name=model,
-                generation_config={
-                    "temperature": temperature,
-                    "top_p": 1.0,
-                    "max_output_tokens": token,
-                }
-            )
-
-            response = model_obj.generate_content(prompt)
-            return response.text.strip() if response and hasattr(response, "text") else ""
-        except Exception as e:
-            return ""
+        prompt = self._build_prompt(messages)
+
+        with tracing.span("gemini.generate", kind="client", model=model):
+            started = time.perf_counter()
+            try:
+                model_obj = self._model(model, token, temperature)
+
+                response = model_obj.generate_content(prompt)
+                self._record(model, started, response=response)
+                return response.text.strip() if response and hasattr(response, "text") else ""
+            except Exception as e:
+                self._record(model, started, error=e)
+                return ""
+
+    async def _agemini_ai(self, messages: list, model: str = "gemini-1.5-flash", token: int = 6000, temperature: float = 0.7) -> str:
+        prompt = self._build_prompt(messages)
+
+        with tracing.span("gemini.generate", kind="client", model=model):
+            started = time.perf_counter()
+            try:
+                model_obj = self._model(model, token, temperature)
+
+                response = await model_obj.generate_content_async(prompt)
+                self._record(model, started, response=response)
+                return response.text.strip() if response and hasattr(response, "text") else ""
+            except Exception as e:
+                self._record(model, started, error=e)
+                return ""
+
+    def _build_prompt(self, messages: list) -> str:
+        return "".join(f"{msg.get('role', 'user').capitalize()}: {msg.get('content', '')}\n" for msg in messages)
+
+    def _model(self, model: str, token: int, temperature: float):
+        key = (model, temperature, token)
+        model_obj = self._models.get(key)
+        if model_obj is None:
+            with self._models_lock:
+                model_obj = self._models.get(key)
+                if model_obj is None:
+                    model_obj = self.genai.GenerativeModel(
+                        model_name=model,
+                        generation_config={
+                            "temperature": temperature,
+                            "top_p": 1.0,
+                            "max_output_tokens": token,
+                        }
+                    )
+                    self._models[key] = model_obj
+        return model_obj
+
+    def _record(self, model: str, started: float, response=None, error: Exception = None):
+        """Count a Gemini call with its latency, token usage and, for a failed call, the error type, and note them on its span."""
+        latency = time.perf_counter() - started
+        usage = getattr(response, "usage_metadata", None)
+        with self._stats_lock:
+            stats = self._call_stats.setdefault(model, {
+                "calls": 0,
+                "errors": 0,
+                "latency_seconds": 0.0,
+                "max_latency_seconds": 0.0,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "error_types": {},
+            })
+            stats["calls"] += 1
+            stats["latency_seconds"] += latency
+            stats["max_latency_seconds"] = max(stats["max_latency_seconds"], latency)
+            if usage is not None:
+                stats["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+                stats["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+            if error is not None:
+                stats["errors"] += 1
+                error_type = type(error).__name__
+                stats["error_types"][error_type] = stats["error_types"].get(error_type, 0) + 1
+
+        span = tracing.current_span()
+        if span is not None:
+            if usage is not None:
+                span.set(
+                    prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+                    output_tokens=getattr(usage, "candidates_token_count", 0) or 0
+                )
+            if error is not None:
+                # The error is turned into an empty answer, the span still shows the call failed.
+                span.fail(error)
+
+    def stats(self) -> dict:
+        """Per-model call counters, plus the summary cache and the number of pooled model clients."""
+        with self._stats_lock:
+            calls = {
+                model: dict(
+                    values,
+                    error_types=dict(values["error_types"]),
+                    avg_latency_seconds=values["latency_seconds"] / values["calls"] if values["calls"] else 0.0
+                )
+                for model, values in self._call_stats.items()
+            }
+        return {"calls": calls, "models": len(self._models), "summary_cache": self.summary_cache.stats()}
 
     # ********** Conversation Summary **********
 
     def conversation_summary(self, conversation: list = []) -> str:
+        """Summarize a conversation, extending the cached summary of its longest already summarized prefix."""
         if not conversation:
             return "No conversation to summarize."
 
+        turns = self._turns(conversation)
+        # Concurrent requests for the same conversation share one Gemini call.
+        return self._summary_flight.do(self.summary_cache.prefix_keys(turns)[-1], self._summarize, turns)
+
+    async def aconversation_summary(self, conversation: list = []) -> str:
+        if not conversation:
+            return "No conversation to summarize."
+
+        turns = self._turns(conversation)
+        covered, summary = self.summary_cache.lookup(turns)
+        if covered == len(turns):
+            return summary
+
+        summary = await self._agemini_ai(self._summary_request(turns, covered, summary), model="gemini-1.5-flash", token=6000, temperature=0.7)
+        self.summary_cache.set(turns, summary)
+        return summary
+
+    def _summarize(self, turns: list) -> str:
+        covered, summary = self.summary_cache.lookup(turns)
+        if covered == len(turns):
+            return summary
+
+        summary = self._gemini_ai(self._summary_request(turns, covered, summary), model="gemini-1.5-flash", token=6000, temperature=0.7)
+        self.summary_cache.set(turns, summary)
+        return summary
+
+    def _summary_request(self, turns: list, covered: int, summary: str) -> list:
+        if covered:
+            return self._extend_summary_messages(summary, turns[covered:])
+        return self._summary_messages(turns)
+
+    @staticmethod
+    def _turns(conversation: list) -> list:
+        return [
+            {
+                "role": str(message.get("role") or "user") if isinstance(message, dict) else "user",
+                "content": str(message.get("content", "") if isinstance(message, dict) else message)
+            }
+            for message in conversation
+        ]
+
+    @staticmethod
+    def _conversation_text(turns: list) -> str:
+        return "".join(f"{turn['role']} - {turn['content']}\n" for turn in turns)
+
+    def _summary_messages(self, conversation: list) -> list:
         system_message = (
             "You are a highly intelligent and concise AI assistant. Your task is to read the following conversation between a human user and an AI assistant and summarize it clearly and accurately. "
             "Focus only on the key topic(s), goals, or problems discussed in the conversation. Ignore small talk and irrelevant details. "
@@ -48,35 +199,85 @@ class ChatEnhancer:
             "Do not add greetings, opinions, or formatting. Return only the summary — no labels or prefixes."
         )
 
-        conversation_text = ""
-        for message in conversation:
-            role = message.get("role", "user") if isinstance(message, dict) else "user"
-            content = message.get("content", "") if isinstance(message, dict) else message
-            conversation_text += f"{role} - {content}\n"
-
-        messages = [
+        return [
             {"role": "system", "content": system_message},
-            {"role": "user", "content": conversation_text}
+            {"role": "user", "content": self._conversation_text(self._turns(conversation))}
         ]
 
-        return self._gemini_ai(messages, model="gemini-1.5-flash", token=6000, temperature=0.7)
+    def _extend_summary_messages(self, summary: str, new_turns: list) -> list:
+        system_message = (
+            "You are a highly intelligent and concise AI assistant. You are given the summary of a conversation between a human user and an AI assistant, followed by the newest messages of that conversation. "
+            "Update the summary so it also covers the new messages, keeping the key topic(s), goals, or problems and dropping small talk and irrelevant details. "
+            "Do not answer or continue the conversation. Do not add greetings, opinions, or formatting. Return only the updated summary — no labels or prefixes."
+        )
+
+        return [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": f"Summary so far: {summary}"},
+            {"role": "user", "content": f"New messages:\n{self._conversation_text(new_turns)}"}
+        ]
 
     # ********** Prompt Enhancement **********
 
+    def _enhancement_context(self, turns: list):
+        """
+            Return (context, stale) for enhancing a prompt without waiting for a summary call where possible.
+
+            A cached summary plus the few turns added since, or a short conversation as it is, is used right
+            away and `stale` tells the caller to refresh the summary in the background. None means the
+            conversation is long and unsummarized, so the summary has to be made first.
+        """
+        covered, summary = self.summary_cache.lookup(turns)
+        if covered == len(turns):
+            return summary, False
+
+        new_text = self._conversation_text(turns[covered:])
+        if len(new_text) > ENHANCE_INLINE_CHARS:
+            return None, True
+        if covered:
+            return f"{summary}\nLatest messages:\n{new_text}", True
+        return new_text, True
+
     def enhance_prompt(self, prompt: str, conversation: list = []) -> str:
-        conversation_summary = self.conversation_summary(conversation) if conversation else "No summary available."
+        conversation_summary = "No summary available."
+        if conversation:
+            turns = self._turns(conversation)
+            context, stale = self._enhancement_context(turns)
+            if context is None:
+                conversation_summary = self.conversation_summary(turns)
+            else:
+                conversation_summary = context
+                if stale:
+                    # Overlaps with the enhancement call below and makes the next one a cache hit.
+                    self._executor.submit(self.conversation_summary, turns)
 
+        return self._gemini_ai(self._enhance_messages(prompt, conversation_summary), model="gemini-1.5-flash", token=1000, temperature=0.7)
+
+    async def aenhance_prompt(self, prompt: str, conversation: list = []) -> str:
+        conversation_summary = "No summary available."
+        if conversation:
+            turns = self._turns(conversation)
+            context, stale = self._enhancement_context(turns)
+            if context is None:
+                conversation_summary = await self.aconversation_summary(turns)
+            else:
+                conversation_summary = context
+                if stale:
+                    task = asyncio.ensure_future(self.aconversation_summary(turns))
+                    self._background_tasks.add(task)
+                    task.add_done_callback(self._background_tasks.discard)
+
+        return await self._agemini_ai(self._enhance_messages(prompt, conversation_summary), model="gemini-1.5-flash", token=1000, temperature=0.7)
+
+    def _enhance_messages(self, prompt: str, conversation_summary: str) -> list:
         system_prompt = (
             "You are a prompt optimization assistant. Your task is to take the user's original prompt and make it clearer, more detailed, and more effective for an AI model to understand. "
             "If a summary of the prior conversation is provided, use it to improve context and add useful details, but do not answer the prompt. "
             "Only return the enhanced version of the prompt as a single sentence or paragraph. Do not include explanations or act like an assistant responding to the prompt."
         )
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": f"Original Prompt: {prompt}"},
             {"role": "user", "content": f"Conversation Summary: {conversation_summary}"}
         ]
-
-        return self._gemini_ai(messages, model="gemini-1.5-flash", token=1000, temperature=0.7)
-
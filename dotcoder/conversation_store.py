@@ -0,0 +1,209 @@
+import os
+import time
+import uuid
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from collections import OrderedDict
+
+
+class ConversationNotFound(LookupError):
+    pass
+
+
+class ConversationStore(ABC):
+    """
+        Append-only chat turns keyed by (owner, conversation id).
+
+        Every backend namespaces conversations by the owner's local id, so a conversation id
+        sent by another user is simply unknown.
+    """
+
+    def new_conversation_id(self) -> str:
+        return uuid.uuid4().hex
+
+    @abstractmethod
+    def load(self, owner: str, conversation_id: str, token: str = None):
+        """Return the turns of a conversation as a list of {"role", "content"} dicts, oldest first, or None if it is unknown."""
+
+    @abstractmethod
+    def append(self, owner: str, conversation_id: str, turns: list, token: str = None):
+        """Append {"role", "content"} turns to a conversation."""
+
+
+# ********** In-Process Backend **********
+
+class InMemoryConversationStore(ConversationStore):
+    def __init__(self, max_conversations: int = 10000):
+        """
+            Keeps the `max_conversations` most recently used conversations of this process only, they are
+            lost on restart and not shared between workers. Use it for development or a single worker.
+        """
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, owner: str, conversation_id: str, token: str = None):
+        with self._lock:
+            turns = self._conversations.get((owner, conversation_id))
+            if turns is None:
+                return None
+            self._conversations.move_to_end((owner, conversation_id))
+            return list(turns)
+
+    def append(self, owner: str, conversation_id: str, turns: list, token: str = None):
+        with self._lock:
+            key = (owner, conversation_id)
+            self._conversations.setdefault(key, []).extend(
+                {"role": turn["role"], "content": turn["content"]} for turn in turns
+            )
+            self._conversations.move_to_end(key)
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+
+
+# ********** SQLite Backend **********
+
+class SQLiteConversationStore(ConversationStore):
+    def __init__(self, path: str = "conversations.sqlite3", max_conversations: int = 100000, max_age: float = 30 * 24 * 3600):
+        """
+            Args:
+                path (str): SQLite file, shared by the worker processes of one host.
+                max_conversations (int): Conversations kept, the least recently appended to are deleted first.
+                max_age (float): Seconds after its last turn a conversation is deleted, 0 keeps them regardless of age.
+        """
+        import sqlite3
+
+        self.max_conversations = max_conversations
+        self.max_age = max_age
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS turns ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "owner TEXT NOT NULL, "
+                "conversation_id TEXT NOT NULL, "
+                "role TEXT NOT NULL, "
+                "content TEXT NOT NULL, "
+                "created_at TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS turns_conversation ON turns (owner, conversation_id, id)")
+            # Last activity per conversation, so pruning never has to scan the turns.
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                "owner TEXT NOT NULL, "
+                "conversation_id TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, "
+                "PRIMARY KEY (owner, conversation_id))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS conversations_updated_at ON conversations (updated_at)")
+            # Conversations stored before pruning existed start their retention now.
+            self._conn.execute(
+                "INSERT OR IGNORE INTO conversations (owner, conversation_id, updated_at) "
+                "SELECT DISTINCT owner, conversation_id, ? FROM turns",
+                (time.time(),)
+            )
+
+    def load(self, owner: str, conversation_id: str, token: str = None):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT role, content FROM turns WHERE owner = ? AND conversation_id = ? ORDER BY id",
+                (owner, conversation_id)
+            ).fetchall()
+        if not rows:
+            return None
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def append(self, owner: str, conversation_id: str, turns: list, token: str = None):
+        created_at = datetime.now().isoformat()
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO turns (owner, conversation_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(owner, conversation_id, turn["role"], turn["content"], created_at) for turn in turns]
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (owner, conversation_id, updated_at) VALUES (?, ?, ?)",
+                (owner, conversation_id, now)
+            )
+            self._prune(now)
+
+    def _prune(self, now: float):
+        # Runs in the append's transaction, deleted conversations come back as unknown.
+        expired = []
+        if self.max_age:
+            expired = self._conn.execute(
+                "SELECT owner, conversation_id FROM conversations WHERE updated_at < ?", (now - self.max_age,)
+            ).fetchall()
+        excess = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] - len(expired) - self.max_conversations
+        if excess > 0:
+            expired += self._conn.execute(
+                "SELECT owner, conversation_id FROM conversations WHERE updated_at >= ? ORDER BY updated_at LIMIT ?",
+                (now - self.max_age if self.max_age else float("-inf"), excess)
+            ).fetchall()
+        if not expired:
+            return
+
+        self._conn.executemany("DELETE FROM turns WHERE owner = ? AND conversation_id = ?", expired)
+        self._conn.executemany("DELETE FROM conversations WHERE owner = ? AND conversation_id = ?", expired)
+
+
+# ********** Firebase RTDB Backend **********
+
+class FirebaseConversationStore(ConversationStore):
+    def __init__(self, database):
+        """
+            Args:
+                database (callable): Returns a pyrebase Database, e.g. `lambda: auth.db`. Turns are pushed under
+                    conversations/<owner>/<conversation_id>.
+        """
+        self.database = database
+
+    def load(self, owner: str, conversation_id: str, token: str = None):
+        turns = self.database().child("conversations").child(owner).child(conversation_id).get(token=token).val()
+        if not turns:
+            return None
+        # Push ids sort chronologically.
+        return [{"role": turn["role"], "content": turn["content"]} for _, turn in sorted(dict(turns).items())]
+
+    def append(self, owner: str, conversation_id: str, turns: list, token: str = None):
+        database = self.database()
+        created_at = datetime.now().isoformat()
+        # Push ids are generated locally, so every turn is written in one multi-path update.
+        database.child("conversations").child(owner).child(conversation_id).update({
+            database.generate_key(): {
+                "role": turn["role"],
+                "content": turn["content"],
+                "created_at": created_at
+            }
+            for turn in turns
+        }, token=token)
+
+
+def create_conversation_store(backend: str = None, database=None) -> ConversationStore:
+    """
+        Build the conversation store selected by `backend` or the CONVERSATION_STORE environment variable.
+
+        Args:
+            backend (str): "sqlite" (default), "firebase" or "memory". "memory" keeps conversations in one
+                process only, so it is meant for development.
+            database (callable): Returns a pyrebase Database, required for the "firebase" backend.
+    """
+    backend = (backend or os.getenv("CONVERSATION_STORE", "sqlite")).lower()
+
+    if backend == "memory":
+        return InMemoryConversationStore()
+    elif backend == "sqlite":
+        return SQLiteConversationStore(
+            os.getenv("CONVERSATION_STORE_PATH", "conversations.sqlite3"),
+            max_conversations=int(os.getenv("CONVERSATION_STORE_MAX_CONVERSATIONS", 100000)),
+            max_age=float(os.getenv("CONVERSATION_STORE_MAX_AGE", 30 * 24 * 3600))
+        )
+    elif backend == "firebase":
+        if database is None:
+            raise ValueError("The firebase conversation store needs the pyrebase database.")
+        return FirebaseConversationStore(database)
+    else:
+        raise ValueError(f"Unknown conversation store backend: {backend}")
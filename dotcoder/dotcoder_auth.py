@@ -1,47 +1,93 @@
 import os
 import json
-import pyrebase
-import firebase_admin
-from firebase_admin import credentials
+import base64
+import hashlib
+import logging
+import threading
+import contextvars
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
+from dotcoder.token_cache import TokenCache
+from dotcoder.single_flight import SingleFlight
+from dotcoder.gallery_cache import GalleryCache
+from dotcoder.live_files import write_live_project, remove_live_project, project_version
+from dotcoder.http_client import get_session, route_module_requests
+from dotcoder.avatar_images import process_avatar
+from dotcoder import request_memo
+from dotcoder.tracing import annotate, trace_methods
+
+logger = logging.getLogger("dotcoder.auth")
+
+# Seconds a profile update waits for its new picture, a slower one finishes in the background.
+AVATAR_WAIT_SECONDS = float(os.getenv("AVATAR_WAIT_SECONDS", 15))
+
+# Every public method is an `auth.<method>` span, the Firebase reads below them are spans of their own.
+@trace_methods("auth", include=("_read_path", "_read_all_live_projects", "_update_profile_picture"))
 class DotCoderAuth:
     def __init__(self):
+        import pyrebase
+        import firebase_admin
+        from firebase_admin import credentials
+
         with open("config.json", "r") as f:
             config = json.load(f)
         cred = credentials.Certificate("dotcoder-dev-sdk.json")
 
         firebase_admin.initialize_app(cred)
         firebase = pyrebase.initialize_app(config)
+        # pyrebase's Database uses `firebase.requests`, its Auth calls the module-level `requests.post`
+        # for every identitytoolkit/securetoken request, so both are pointed at the pooled keep-alive session.
+        firebase.requests = get_session()
+        route_module_requests(pyrebase.pyrebase)
 
+        self.firebase = firebase
         self.auth = firebase.auth()
-        self.db = firebase.database()
+        # Independent Firebase calls of one flow run concurrently on this pool.
+        self._executor = ThreadPoolExecutor(max_workers=int(os.getenv("FIREBASE_IO_WORKERS", 16)))
+        # Avatar decoding and resizing is CPU bound, a small pool keeps it off the request threads.
+        self._image_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AVATAR_WORKERS", 2)))
+        self._avatar_stats_lock = threading.Lock()
+        self._avatar_stats = {"updated": 0, "failed": 0, "background": 0}
+
+        self.token_cache = TokenCache(
+            ttl=int(os.getenv("TOKEN_CACHE_TTL", 300)),
+            max_size=int(os.getenv("TOKEN_CACHE_MAX_SIZE", 10000))
+        )
+        self._refresh_flight = SingleFlight(result_ttl=30)
+
+        # GALLERY_CACHE_TTL=0 turns the shared gallery snapshot off and pages are queried from Firebase.
+        self.gallery_cache = GalleryCache(
+            ttl=float(os.getenv("GALLERY_CACHE_TTL", 30)),
+            stale_ttl=float(os.getenv("GALLERY_CACHE_STALE_TTL", 300))
+        )
     
 
-    def _create_profile_picture(self, user_id: str, default_picture: bool = False, image: bytes = None):
-        """Save a profile picture (default or custom image) for the user and return its URL."""
-        import requests
-        
+    @property
+    def db(self):
+        """
+        A fresh pyrebase Database for every use.
+        Database.child() keeps the path on the instance, so a shared one is not safe across threads.
+        """
+        return self.firebase.database()
 
-        if user_id is None:
-            return None
+    # Shipped with the app and shared by every user without a custom picture.
+    DEFAULT_PROFILE_PICTURE_URL = "http://127.0.0.1:5000/static/profile/default_avatar.png"
 
-        save_path = f"static/profile/profile_image/{user_id}.png"
-        os.makedirs("static/profile/profile_image", exist_ok=True)
+    @staticmethod
+    def _profile_picture_url(user_id: str) -> str:
+        """URL of the per-user picture written before pictures were content-addressed."""
+        return f"http://127.0.0.1:5000/static/profile/profile_image/{user_id}.png"
 
-        if default_picture:
-            default_picture_url = "https://cdn.pixabay.com/photo/2023/02/18/11/00/icon-7797704_1280.png"
-            with open(save_path, "wb") as f:
-                f.write(requests.get(default_picture_url).content)
+    def _create_profile_picture(self, user_id: str, default_picture: bool = False, image: bytes = None):
+        """Return the URL of the shared default picture, or resize a custom image into thumbnails and return their URL."""
+        if user_id is None:
+            return None
 
-        if image is not None:
-            with open(save_path, "wb") as f:
-                f.write(image)
+        if image is None:
+            return self.DEFAULT_PROFILE_PICTURE_URL if default_picture else None
 
-        if os.path.exists(save_path):
-            return f"http://127.0.0.1:5000/static/profile/profile_image/{user_id}.png"
-        else:
-            return None
+        return process_avatar(image)
     
 
     def sign_up(self, name: str, username: str, email: str, password: str):
@@ -52,32 +98,37 @@ class DotCoderAuth:
                 password=password
             )
 
-            self.auth.send_email_verification(user["idToken"])
             if not user:
                 return {"error": "User creation failed"}
 
+            # Everything after account creation is independent and both database records
+            # go out as one atomic multi-path update.
             profile_picture = self._create_profile_picture(user["localId"], default_picture=True)
-
-            self.auth.update_profile(user["idToken"], display_name=name, photo_url=profile_picture)
-
             created_at = datetime.now().isoformat()
 
-            self.db.child("users").child(user["localId"]).set({
-                "local_id": user["localId"],
-                "name": name,
-                "username": username,
-                "email": email,
-                "profile_picture": profile_picture,
-                "created_at": created_at,
-            }, token=user["idToken"])
-
-            self.db.child("usernames").child(username).set({
-                "local_id": user["localId"],
-                "name": name,
-                "email": email,
-                "profile_picture": profile_picture,
-                "created_at": created_at,
-            }, token=user["idToken"])
+            futures = [
+                self._executor.submit(self.auth.send_email_verification, user["idToken"]),
+                self._executor.submit(self.auth.update_profile, user["idToken"], display_name=name, photo_url=profile_picture),
+                self._executor.submit(self.db.update, {
+                    f"users/{user['localId']}": {
+                        "local_id": user["localId"],
+                        "name": name,
+                        "username": username,
+                        "email": email,
+                        "profile_picture": profile_picture,
+                        "created_at": created_at,
+                    },
+                    f"usernames/{username}": {
+                        "local_id": user["localId"],
+                        "name": name,
+                        "email": email,
+                        "profile_picture": profile_picture,
+                        "created_at": created_at,
+                    },
+                }, token=user["idToken"]),
+            ]
+            for future in futures:
+                future.result()
 
             return user
 
@@ -155,7 +206,13 @@ class DotCoderAuth:
                     
 
     def refresh_token(self, refresh_token: str):
-        """Refresh the user's authentication token."""
+        """Refresh the user's authentication token, sharing one in-flight refresh between concurrent requests of a session."""
+        if not refresh_token:
+            return None
+        key = hashlib.sha256(refresh_token.encode("utf-8")).hexdigest()
+        return self._refresh_flight.do(key, self._refresh_token, refresh_token)
+
+    def _refresh_token(self, refresh_token: str):
         try:
             user = self.auth.refresh(refresh_token)
             return user
@@ -163,13 +220,28 @@ class DotCoderAuth:
             return None
 
     def account_info(self, id_token):
-        """Retrieve account information for a user."""
+        """
+            Retrieve account information for a user, served from the token cache when the token was verified recently.
+            Within a request the result is remembered, so helpers can call this again for free.
+        """
+        return request_memo.memoized(("account_info", id_token), self._account_info, id_token)
+
+    def _account_info(self, id_token):
+        cached_info = self.token_cache.get(id_token)
+        if cached_info is not None:
+            annotate(cache_hit=True)
+            return cached_info
         try:
             account_info = self.auth.get_account_info(id_token)
+            self.token_cache.set(id_token, account_info)
             return account_info
         except Exception as e:
             return None
 
+    def sign_out(self, id_token: str):
+        """Forget a token locally so it is verified against Firebase again if it is ever reused."""
+        self.token_cache.invalidate(id_token)
+
     def reset_password(self, email: str):
         """Send a password reset email to the user."""
         try:
@@ -192,12 +264,19 @@ class DotCoderAuth:
             self.db.child("users").child(user_id).remove(token=id_token)
             self.db.child("usernames").order_by_child("user_id").equal_to(user_id).get().each(lambda x: x.ref.remove(token=id_token))
             self.auth.delete_user(id_token)
+            self.token_cache.invalidate(id_token)
             return True
         except Exception as e:
             return False
 
-    def update_profile(self, id_token: str, name: str = None, profile_picture: str = None):
-        """Update the user's profile information."""
+    def update_profile(self, id_token: str, name: str = None, profile_picture: bytes = None):
+        """
+            Update the user's profile information.
+
+            The name is written right away. A new picture is resized on the image pool and written once its
+            thumbnails exist, a failure there fails the update unless it takes longer than AVATAR_WAIT_SECONDS,
+            then it finishes in the background and a failure is only logged and counted.
+        """
         try:
             user_info = self.auth.get_account_info(id_token)
             user_id = user_info["users"][0]["localId"]
@@ -209,46 +288,111 @@ class DotCoderAuth:
             if name:
                 updates["name"] = name
 
-            if profile_picture is not None:
-                image_path = self._create_profile_picture(user_id, image=profile_picture)
-                updates["profile_picture"] = image_path
-
-            self.db.child("users").child(user_id).update(updates, token=id_token)
-            self.db.child("usernames").child(user_data["username"]).update(updates, token=id_token)
+            if updates:
+                self._write_profile_updates(id_token, user_id, user_data, updates)
 
-            self.auth.update_profile(id_token, display_name=updates.get("name"), photo_url=updates.get("profile_picture"))
+            if profile_picture is not None:
+                future = self._image_executor.submit(
+                    contextvars.copy_context().run, self._update_profile_picture, id_token, user_id, user_data, profile_picture
+                )
+                try:
+                    future.result(timeout=AVATAR_WAIT_SECONDS)
+                except TimeoutError:
+                    self._count_avatar("background")
+                # The write ran in a copy of this context, drop the profile reads it made stale here too.
+                request_memo.forget(("db", "users", user_id), ("db", "usernames", user_data["username"]))
 
             return True
         except Exception as e:
             return False
 
+    def _update_profile_picture(self, id_token: str, user_id: str, user_data: dict, image: bytes):
+        try:
+            profile_picture = self._create_profile_picture(user_id, image=image)
+            self._write_profile_updates(id_token, user_id, user_data, {"profile_picture": profile_picture})
+        except Exception:
+            logger.exception("Updating the profile picture of user %s failed", user_id)
+            self._count_avatar("failed")
+            raise
+        self._count_avatar("updated")
+
+    def _count_avatar(self, key: str):
+        with self._avatar_stats_lock:
+            self._avatar_stats[key] += 1
+
+    def avatar_stats(self) -> dict:
+        """Profile pictures written, failed, and finished in the background after the request had returned."""
+        with self._avatar_stats_lock:
+            return dict(self._avatar_stats)
+
+    def _write_profile_updates(self, id_token: str, user_id: str, user_data: dict, updates: dict):
+        paths = {}
+        for key, value in updates.items():
+            paths[f"users/{user_id}/{key}"] = value
+            paths[f"usernames/{user_data['username']}/{key}"] = value
+
+        # Gallery cards keep a copy of the picture URL, point them at the new content-addressed file.
+        gallery_keys = []
+        if "profile_picture" in updates:
+            live_projects = self.db.child("live_projects").child(user_id).child("live_project").get(token=id_token).val() or {}
+            gallery_keys = [f"{user_data['username']}--__SEP__--{project_url}" for project_url in dict(live_projects)]
+            for gallery_key in gallery_keys:
+                paths[f"all_user_projects/{gallery_key}/profile_picture"] = updates["profile_picture"]
+
+        if paths:
+            self.db.update(paths, token=id_token)
+            request_memo.forget(("db", "users", user_id), ("db", "usernames", user_data["username"]))
+        for gallery_key in gallery_keys:
+            self.gallery_cache.update_fields(gallery_key, {"profile_picture": updates["profile_picture"]})
+
+        self.auth.update_profile(id_token, display_name=updates.get("name"), photo_url=updates.get("profile_picture"))
+
+    def _read_path(self, path: tuple, token: str):
+        node = self.db
+        for part in path:
+            node = node.child(part)
+        return node.get(token=token).val()
+
+    def _read_memoized(self, path: tuple, token: str):
+        return request_memo.memoized(("db",) + path, self._read_path, path, token)
+
     def get_user_by_id_token(self, token: str = None, get_username_data: bool = False, get_live_projects_data: bool = False):
-        """Retrieve user information by local ID."""
+        """
+            Retrieve user information by local ID.
+
+            The users and live_projects records are read concurrently and remembered for the rest of the request,
+            so handlers that call this again (directly or through remove_project) do not reach Firebase twice.
+        """
         try:
-            get_local_id_data = True
             data = {}
-            if get_local_id_data:
+            try:
+                local_id = self.account_info(token)["users"][0]["localId"]
+            except:
+                local_id = None
+
+            reads = {"local_id_data": ("users", local_id)}
+            if get_live_projects_data:
+                reads["live_projects_data"] = ("live_projects", local_id, "live_project")
+
+            # Each read runs in a copy of this context, so it shares the request's memo.
+            futures = {
+                name: self._executor.submit(contextvars.copy_context().run, self._read_memoized, path, token)
+                for name, path in reads.items() if local_id is not None
+            }
+            for name in reads:
                 try:
-                    local_id = self.account_info(token)["users"][0]["localId"]
-                    user_data = self.db.child("users").child(local_id).get(token=token).val()
-                    data["local_id_data"] = user_data if user_data else {}
+                    value = futures[name].result()
+                    data[name] = dict(value) if value else {}
                 except:
-                    data["local_id_data"] = {}
+                    data[name] = {}
 
             if get_username_data:
                 try:
-                    username_data = self.db.child("usernames").child(data.get("local_id_data", {}).get("username")).get(token=token).val()
+                    username_data = self._read_memoized(("usernames", data["local_id_data"].get("username")), token)
                     data["username_data"] = username_data if username_data else {}
                 except:
                     data["username_data"] = {}
 
-            if get_live_projects_data:
-                try:
-                    live_projects = dict(self.db.child("live_projects").child(local_id).child("live_project").get(token=token).val())
-                    data["live_projects_data"] = live_projects if live_projects else {}
-                except:
-                    data["live_projects_data"] = {}
-
             return data
         except Exception as e:
             return None
@@ -266,37 +410,64 @@ class DotCoderAuth:
             return None
     
 
-    def add_live_project(self, id_token: str, local_id: str, project_url, username: str, code: str, description: str):
+    def add_live_project(self, id_token: str, local_id: str, project_url, username: str, code: str, description: str, profile_picture: str = None):
         """Add a live project for the user."""
         try:
             url = f"http://127.0.0.1:5000/live/{username}/{project_url}"
+            version = project_version(code)
             created_at = datetime.now().isoformat()
-            self.db.child("live_projects").child(local_id).child("live_project").child(project_url).set({
-                "project_url": project_url,
-                "url": url,
-                "timestamp": created_at,
-                "description": description
-            }, token=id_token)
 
-            profile_picture = f"http://127.0.0.1:5000/static/profile/profile_image/{local_id}.png"
+            profile_picture = profile_picture or self._profile_picture_url(local_id)
 
-            self.db.child("all_user_projects").child(f"{username}--__SEP__--{project_url}").set({
+            gallery_project = {
                 "project_url": project_url,
                 "url": url,
+                "version": version,
                 "timestamp": created_at,
                 "username": username,
                 "profile_picture": profile_picture,
                 "description": description
+            }
+
+            project_path = f"live_projects/{local_id}/live_project/{project_url}"
+            gallery_path = f"all_user_projects/{username}--__SEP__--{project_url}"
+
+            # Both records in one atomic multi-path update, written while the files are compressed to disk.
+            db_write = self._executor.submit(self.db.update, {
+                project_path: {
+                    "project_url": project_url,
+                    "url": url,
+                    "version": version,
+                    "timestamp": created_at,
+                    "description": description
+                },
+                gallery_path: gallery_project,
             }, token=id_token)
 
-            if not os.path.exists("static/live_projects"):
-                os.makedirs("static/live_projects", exist_ok=True)
-
-            if not os.path.exists(f"static/live_projects/{username}"):
-                os.makedirs(f"static/live_projects/{username}")
-
-            with open(f"static/live_projects/{username}/{project_url}.html", "wb") as file:
-                file.write(code.encode("utf-8"))
+            # Whichever side fails, the other is undone, so records never point at missing files and files
+            # never outlive their records. A failed republish leaves the project unpublished.
+            try:
+                write_live_project(username, project_url, code)
+            except Exception:
+                try:
+                    db_write.result()
+                except Exception:
+                    pass
+                else:
+                    self.db.update({project_path: None, gallery_path: None}, token=id_token)
+                    self.gallery_cache.remove(f"{username}--__SEP__--{project_url}")
+                    request_memo.forget(("db", "live_projects", local_id, "live_project"))
+                remove_live_project(username, project_url)
+                raise
+
+            try:
+                db_write.result()
+            except Exception as e:
+                remove_live_project(username, project_url)
+                raise
+
+            self.gallery_cache.upsert(f"{username}--__SEP__--{project_url}", gallery_project)
+            request_memo.forget(("db", "live_projects", local_id, "live_project"))
 
             return True
         except Exception as e:
@@ -309,24 +480,91 @@ class DotCoderAuth:
             username = data.get("local_id_data", {}).get("username")
             local_id = data.get("local_id_data", {}).get("local_id")
 
-            self.db.child("live_projects").child(local_id).child("live_project").child(project_url).remove(token=token)
-            self.db.child("all_user_projects").child(f"{username}--__SEP__--{project_url}").remove(token=token)
+            self.db.update({
+                f"live_projects/{local_id}/live_project/{project_url}": None,
+                f"all_user_projects/{username}--__SEP__--{project_url}": None,
+            }, token=token)
+            self.gallery_cache.remove(f"{username}--__SEP__--{project_url}")
+            request_memo.forget(("db", "live_projects", local_id, "live_project"))
 
-
-            path = f"static/live_projects/{username}/{project_url}.html"
-            if os.path.exists(path):
-                os.remove(path)
-                return True
-            else:
-                return True
+            remove_live_project(username, project_url)
+            return True
 
         except Exception as e:
             return False
         
     def get_all_live_projects_data(self, token: str):
+        if self.gallery_cache.ttl > 0:
+            projects_data = self.gallery_cache.get_all(lambda: self._read_all_live_projects(token))
+            return projects_data if projects_data is not None else False
+        projects_data = self._read_all_live_projects(token)
+        return projects_data if projects_data is not None else False
+
+    def _read_all_live_projects(self, token: str):
         try:
-            projects_data = self.db.child("all_user_projects").get(token=token).val()
-            return projects_data
+            return self.db.child("all_user_projects").get(token=token).val() or {}
         except Exception as e:
-            return False
+            return None
+
+    @staticmethod
+    def _encode_cursor(project: dict) -> str:
+        raw = json.dumps([project.get("timestamp", ""), project["key"]]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str):
+        try:
+            timestamp, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return str(timestamp), str(key)
+        except Exception:
+            return None
+
+    def get_live_projects_page(self, token: str, page_size: int = 24, cursor: str = None):
+        """
+        Return one page of the gallery, newest first, as {"projects": [...], "next_cursor": str or None}.
+
+        Pages are served from the shared gallery snapshot. With GALLERY_CACHE_TTL=0 an orderBy("timestamp")
+        query is used instead, so all_user_projects needs `".indexOn": ["timestamp"]` in the database rules.
+        Without the index Firebase rejects the query and the whole node is read.
+        """
+        position = self._decode_cursor(cursor) if cursor else None
+
+        if self.gallery_cache.ttl > 0:
+            page = self.gallery_cache.page(lambda: self._read_all_live_projects(token), page_size, position)
+            if page is None:
+                return None
+            projects, has_more = page
+            return {"projects": projects, "next_cursor": self._encode_cursor(projects[-1]) if has_more and projects else None}
+
+        # One extra for the cursor item itself (end_at is inclusive) and one to know if there is a next page.
+        limit = page_size + 2
+
+        while True:
+            try:
+                query = self.db.child("all_user_projects").order_by_child("timestamp")
+                if position is not None:
+                    query = query.end_at(position[0])
+                projects_data = dict(query.limit_to_last(limit).get(token=token).val() or {})
+                complete = len(projects_data) < limit
+            except Exception as e:
+                projects_data = self._read_all_live_projects(token)
+                if projects_data is None:
+                    return None
+                projects_data = dict(projects_data)
+                complete = True
+
+            projects = [dict(project, key=key) for key, project in projects_data.items() if isinstance(project, dict)]
+            projects.sort(key=lambda project: (project.get("timestamp", ""), project["key"]), reverse=True)
+
+            if position is not None:
+                projects = [project for project in projects if (project.get("timestamp", ""), project["key"]) < position]
+
+            # Items sharing the cursor's timestamp can fill the window, widen it until the page is full.
+            if len(projects) > page_size or complete:
+                break
+            limit *= 2
+
+        page = projects[:page_size]
+        next_cursor = self._encode_cursor(page[-1]) if len(projects) > page_size else None
+        return {"projects": page, "next_cursor": next_cursor}
 
@@ -1,31 +1,139 @@
-from langchain.tools import Tool
+import threading
+import functools
+from typing import Literal, Optional
 
+from pydantic import BaseModel, Field
+from langchain_core.tools import StructuredTool
+
+from dotcoder import metrics, tracing
 from dotcoder.google_search_tool import GoogleSearchTool
 from dotcoder.github_tool import GitHubTool
 
 
+# *************** Call Counters ****************
+
+_stats_lock = threading.Lock()
+_tool_stats = {}
+
+
+def _count(tool_name: str, key: str):
+    with _stats_lock:
+        stats = _tool_stats.setdefault(tool_name, {"calls": 0, "invalid_calls": 0})
+        stats[key] += 1
+
+
+def stats() -> dict:
+    """Per-tool call counts, `invalid_calls` were rejected by the schema before reaching the tool."""
+    with _stats_lock:
+        return {tool_name: dict(values) for tool_name, values in _tool_stats.items()}
+
+
+def _plain(kwargs: dict) -> dict:
+    # The tools take plain dicts, validated nested inputs arrive as models with their defaults filled in.
+    return {key: value.model_dump() if isinstance(value, BaseModel) else value for key, value in kwargs.items()}
+
+
+def _counted(tool_name: str, func, coroutine):
+    # Each call is a `tool.<name>` span under the agent run, the tools mark cache hits on it.
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        _count(tool_name, "calls")
+        with tracing.span(f"tool.{tool_name}", kind="client"):
+            return func(*args, **_plain(kwargs))
+
+    @functools.wraps(coroutine)
+    async def arun(*args, **kwargs):
+        _count(tool_name, "calls")
+        with tracing.span(f"tool.{tool_name}", kind="client"):
+            return await coroutine(*args, **_plain(kwargs))
+
+    return run, arun
+
+
+def _validation_error_handler(tool_name: str):
+    """Turn a schema error into a short observation, so the model can fix its call without the run failing."""
+    def handle(error) -> str:
+        _count(tool_name, "invalid_calls")
+        problems = "; ".join(
+            f"{'.'.join(str(part) for part in problem['loc'])}: {problem['msg']}" for problem in error.errors()
+        )
+        return f"Invalid arguments for {tool_name}: {problems}. Fix the arguments and call the tool again."
+
+    return handle
+
+
+def _structured_tool(name: str, func, coroutine, args_schema, description: str) -> StructuredTool:
+    run, arun = _counted(name, func, coroutine)
+    return StructuredTool.from_function(
+        func=run,
+        coroutine=arun,
+        name=name,
+        description=description,
+        args_schema=args_schema,
+        handle_validation_error=_validation_error_handler(name)
+    )
+
+
 # *************** Google Search Tool ****************
 
+class GoogleSearchInput(BaseModel):
+    search_query: str = Field(min_length=1, description="The search term, or the URL when search_type is Webpage.")
+    search_type: Literal["Search", "Images", "Videos", "News", "Webpage"] = Field("Search", description="Kind of results to return.")
+    k: int = Field(10, ge=1, le=100, description="Number of results to return.")
+
+
+class GoogleSearchToolInput(BaseModel):
+    data_for_search: GoogleSearchInput
+
+
 google_search = GoogleSearchTool()
 
-google_search_tool = Tool(
+google_search_tool = _structured_tool(
     name="GoogleSearchTool",
     func=google_search.google_search,
+    coroutine=google_search.agoogle_search,
+    args_schema=GoogleSearchToolInput,
     description=google_search.google_search.__doc__
 )
 
 # **************** GitHub Search Tool ****************
 
+class GitHubCodeSearchInput(BaseModel):
+    query: str = Field(min_length=1, description="Keywords to search for within code files.")
+    max_results: int = Field(10, ge=1, le=100, description="Number of results to return.")
+    repo: Optional[str] = Field(None, pattern=r"^[\w.-]+/[\w.-]+$", description="Restrict the search to one repository, as owner/repo.")
+    file_format: Literal["html"] = Field("html", description="File type to search, always html.")
+
+
+class GitHubCodeSearchToolInput(BaseModel):
+    data_for_search: GitHubCodeSearchInput
+
+
+class GetContentFromUrlInput(BaseModel):
+    url: str = Field(pattern=r"^https?://\S+$", description="Direct raw URL of the file.")
+
+
 github_search = GitHubTool()
 
-github_code_url_search_tool = Tool(
+github_code_url_search_tool = _structured_tool(
     name="GitHubCodeUrlSearchTool",
     func=github_search.search_github_code_urls,
+    coroutine=github_search.asearch_github_code_urls,
+    args_schema=GitHubCodeSearchToolInput,
     description=github_search.search_github_code_urls.__doc__
 )
 
-get_content_from_url_tool = Tool(
+get_content_from_url_tool = _structured_tool(
     name="GetContentFromUrlTool",
     func=github_search.get_content_from_url,
+    coroutine=github_search.aget_content_from_url,
+    args_schema=GetContentFromUrlInput,
     description=github_search.get_content_from_url.__doc__
 )
+
+
+# **************** Metrics ****************
+
+metrics.register("tool", stats, label="tool")
+metrics.register("search_cache", google_search.cache.stats)
+metrics.register("url_content_cache", github_search.content_cache.stats)
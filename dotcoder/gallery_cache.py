@@ -0,0 +1,148 @@
+import time
+import bisect
+import threading
+
+from dotcoder.single_flight import SingleFlight
+
+
+class GalleryCache:
+    def __init__(self, ttl: float = 30, stale_ttl: float = 300):
+        """
+            Process-wide snapshot of all_user_projects shared by every gallery view.
+
+            Args:
+                ttl (float): Seconds the snapshot is served without refreshing.
+                stale_ttl (float): Seconds after that during which the old snapshot is still served
+                    while a background thread refreshes it. Older snapshots are reloaded in the request.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self._projects = None
+        self._order = []
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._load_flight = SingleFlight(result_ttl=0)
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.loads = 0
+
+    # ********** Snapshot **********
+
+    def _store(self, projects_data: dict):
+        projects = {key: project for key, project in dict(projects_data or {}).items() if isinstance(project, dict)}
+        with self._lock:
+            self._projects = projects
+            self._order = sorted((project.get("timestamp", ""), key) for key, project in projects.items())
+            self._fetched_at = time.time()
+            self.loads += 1
+
+    def _load(self, loader):
+        projects_data = loader()
+        if projects_data is None:
+            return None
+        self._store(projects_data)
+        return True
+
+    def _refresh_in_background(self, loader):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._load(loader)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _ensure(self, loader) -> bool:
+        """Make sure a usable snapshot exists, `loader()` returns the raw all_user_projects node or None on failure."""
+        with self._lock:
+            age = time.time() - self._fetched_at
+            has_snapshot = self._projects is not None
+
+        if has_snapshot and age < self.ttl:
+            with self._lock:
+                self.hits += 1
+            return True
+
+        if has_snapshot and age < self.ttl + self.stale_ttl:
+            with self._lock:
+                self.stale_hits += 1
+            self._refresh_in_background(loader)
+            return True
+
+        # Concurrent cold views share one Firebase read.
+        return self._load_flight.do("gallery", self._load, loader) is not None
+
+    # ********** Public API **********
+
+    def get_all(self, loader):
+        """Return the whole gallery as {key: project}, or None if it could not be loaded."""
+        if not self._ensure(loader):
+            return None
+        with self._lock:
+            return dict(self._projects)
+
+    def page(self, loader, page_size: int, position=None):
+        """
+            Return (projects, has_more) for the page after `position` (a (timestamp, key) tuple), newest first,
+            or None if the gallery could not be loaded.
+        """
+        if not self._ensure(loader):
+            return None
+        with self._lock:
+            end = bisect.bisect_left(self._order, position) if position is not None else len(self._order)
+            start = max(end - page_size, 0)
+            projects = [dict(self._projects[key], key=key) for _, key in reversed(self._order[start:end])]
+            return projects, start > 0
+
+    def upsert(self, key: str, project: dict):
+        """Patch a published project into the snapshot so it shows up immediately."""
+        with self._lock:
+            if self._projects is None:
+                return
+            old = self._projects.get(key)
+            if old is not None:
+                self._order.remove((old.get("timestamp", ""), key))
+            self._projects[key] = project
+            bisect.insort(self._order, (project.get("timestamp", ""), key))
+
+    def update_fields(self, key: str, fields: dict):
+        """Patch fields that do not affect the order, e.g. a new profile picture."""
+        with self._lock:
+            if self._projects is None or key not in self._projects:
+                return
+            self._projects[key] = dict(self._projects[key], **fields)
+
+    def remove(self, key: str):
+        with self._lock:
+            if self._projects is None:
+                return
+            old = self._projects.pop(key, None)
+            if old is not None:
+                self._order.remove((old.get("timestamp", ""), key))
+
+    def invalidate(self):
+        with self._lock:
+            self._projects = None
+            self._order = []
+            self._fetched_at = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "loads": self.loads,
+                "projects": len(self._projects or {}),
+                "age": time.time() - self._fetched_at if self._projects is not None else None,
+            }
@@ -1,17 +1,28 @@
 class GitHubTool:
-    def __init__(self, github_token=None):
+    MAX_CONTENT_LINES = 50000
+
+    def __init__(self, github_token=None, content_cache=None):
         """
             Initialize the GitHubTool with a GitHub token.
 
             Args:
                 github_token (str): Optional GitHub token. If not provided, it will be loaded from environment variables.
+                content_cache (UrlContentCache): Optional cache for fetched file contents. By default one is built in URL_CONTENT_CACHE_DIR.
         """
         import os
+        from dotcoder.url_content_cache import UrlContentCache
 
         self.GITHUB_TOKEN = github_token or os.getenv("GITHUB_TOKEN")
 
         if not self.GITHUB_TOKEN:
             raise ValueError("GITHUB_TOKEN is not set. Pass it as an argument or set it in environment variables.")
+
+        self.content_cache = content_cache or UrlContentCache(
+            os.getenv("URL_CONTENT_CACHE_DIR", ".cache/url_content"),
+            max_bytes=int(os.getenv("URL_CONTENT_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+            max_age=float(os.getenv("URL_CONTENT_CACHE_MAX_AGE", 7 * 24 * 3600))
+        )
+        self.max_content_bytes = int(os.getenv("URL_CONTENT_MAX_BYTES", 5 * 1024 * 1024))
         
     # ********** GitHub Search Tool **********
 
@@ -51,8 +62,29 @@ class GitHubTool:
         If the user requests—or if you need to find HTML code to improve the website—you can use this tool to search for relevant code files in public or specific repositories.
         """
 
-        import requests
+        from dotcoder.http_client import get_session
+
+        url, headers, params = self._build_search_request(data_for_search)
+
+        response = get_session().get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            return [f"❌ Error {response.status_code}: {response.text}"]
 
+        return self._parse_search_results(response.json())
+
+    async def asearch_github_code_urls(self, data_for_search: dict = {}) -> list:
+        """Async version of `search_github_code_urls` running on the shared pooled HTTP client."""
+        from dotcoder.http_client import get_async_client
+
+        url, headers, params = self._build_search_request(data_for_search)
+
+        response = await get_async_client().get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            return [f"❌ Error {response.status_code}: {response.text}"]
+
+        return self._parse_search_results(response.json())
+
+    def _build_search_request(self, data_for_search: dict):
         headers = {
             "Accept": "application/vnd.github+json",
             "Authorization": f"Bearer {self.GITHUB_TOKEN}"
@@ -70,12 +102,11 @@ class GitHubTool:
             "per_page": data_for_search.get("max_results", 10)
         }
 
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code != 200:
-            return [f"❌ Error {response.status_code}: {response.text}"]
+        return url, headers, params
 
+    def _parse_search_results(self, response_data: dict) -> list:
         results = []
-        for item in response.json().get("items", []):
+        for item in response_data.get("items", []):
             results.append({
                 "repo": item["repository"]["full_name"],
                 "description": item["repository"].get("description", "No description available"),
@@ -100,19 +131,71 @@ class GitHubTool:
         If the URL is invalid, the file is inaccessible, or the content is empty, the tool returns an error message.
         Use this tool to analyze, summarize, or transform live code from public repositories or other raw sources, and you are allowed to use the fetched content directly in your own code or outputs.
         """
-        import requests
-
-        response = requests.get(url)
-        if response.status_code != 200:
-            return f"❌ Error {response.status_code}: {response.text}"
-
-        content = response.content.decode('utf-8')
+        return self._fetch_content(url, self.content_cache.conditional_headers(url))
+
+    async def aget_content_from_url(self, url: str) -> str:
+        """Async version of `get_content_from_url` running on the shared pooled HTTP client."""
+        import asyncio
+
+        # The cache reads SQLite and writes bodies of up to URL_CONTENT_MAX_BYTES, so it runs off the event loop.
+        return await self._afetch_content(url, await asyncio.to_thread(self.content_cache.conditional_headers, url))
+
+    def _fetch_content(self, url: str, headers: dict) -> str:
+        from dotcoder.http_client import get_session
+        from dotcoder.tracing import annotate
+        from dotcoder.url_content_cache import ContentTruncator
+
+        with get_session().get(url, headers=headers, stream=True) as response:
+            if response.status_code == 304 and headers:
+                cached = self.content_cache.get(url)
+                if cached is not None:
+                    annotate(cache_hit=True)
+                    return self._content_or_message(cached)
+                # The cached body is gone, fetch it again without validators.
+                return self._fetch_content(url, {})
+
+            if response.status_code != 200:
+                return f"❌ Error {response.status_code}: {response.text}"
+
+            truncator = ContentTruncator(self.max_content_bytes, self.MAX_CONTENT_LINES)
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if truncator.feed(chunk):
+                    break
+
+            content = truncator.text()
+            self.content_cache.set(url, content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        return self._content_or_message(content)
+
+    async def _afetch_content(self, url: str, headers: dict) -> str:
+        import asyncio
+        from dotcoder.http_client import get_async_client
+        from dotcoder.tracing import annotate
+        from dotcoder.url_content_cache import ContentTruncator
+
+        async with get_async_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and headers:
+                cached = await asyncio.to_thread(self.content_cache.get, url)
+                if cached is not None:
+                    annotate(cache_hit=True)
+                    return self._content_or_message(cached)
+                return await self._afetch_content(url, {})
+
+            if response.status_code != 200:
+                body = await response.aread()
+                return f"❌ Error {response.status_code}: {body.decode('utf-8', errors='ignore')}"
+
+            truncator = ContentTruncator(self.max_content_bytes, self.MAX_CONTENT_LINES)
+            async for chunk in response.aiter_bytes(64 * 1024):
+                if truncator.feed(chunk):
+                    break
+
+            content = truncator.text()
+            await asyncio.to_thread(self.content_cache.set, url, content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+        return self._content_or_message(content)
+
+    def _content_or_message(self, content: str) -> str:
         if not content:
             return "No content found at the provided URL."
-        
-        content_tokens = content.splitlines()
-        if len(content_tokens) <= 50000:
-            return content
-        else:
-            return "\n".join(content_tokens[0:50000])
-
+        return content
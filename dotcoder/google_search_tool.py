@@ -1,12 +1,34 @@
 class GoogleSearchTool():
-    def __init__(self, serper_api_key=None):
+    # Seconds a Serper response is reused, per search type.
+    CACHE_TTL = {
+        "Search": 60 * 60,
+        "Images": 24 * 60 * 60,
+        "Videos": 24 * 60 * 60,
+        "News": 10 * 60,
+        "Webpage": 7 * 24 * 60 * 60,
+    }
+
+    def __init__(self, serper_api_key=None, cache=None):
+        """
+            Initialize the GoogleSearchTool with a Serper API key.
+
+            Args:
+                serper_api_key (str): Optional Serper API key. If not provided, it will be loaded from environment variables.
+                cache (ResponseCache): Optional response cache. By default one is built from SEARCH_CACHE_MAX_BYTES and SEARCH_CACHE_PATH.
+        """
         import os
+        from dotcoder.response_cache import ResponseCache
 
         self.SERPER_API_KEY = serper_api_key or os.getenv("SERPER_API_KEY")
 
         if not self.SERPER_API_KEY:
             raise ValueError("SERPER_API_KEY is not set. Pass it as an argument or set it in environment variables.")
 
+        self.cache = cache or ResponseCache(
+            max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+            disk_path=os.getenv("SEARCH_CACHE_PATH")
+        )
+
 
     # ********** Google Search Tool **********
 
@@ -37,6 +59,65 @@ class GoogleSearchTool():
         If the user requests—or if the AI determines that images, videos, or news articles would enhance the response—you can use this tool to fetch relevant and up-to-date content.
         """
 
+        from dotcoder.tracing import annotate
+
+        request_data = self._build_request(data_for_search)
+        if isinstance(request_data, str):
+            return request_data
+
+        cache_key = self._cache_key(data_for_search)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+
+        from dotcoder.http_client import get_session
+
+        url, headers, payload = request_data
+        response = get_session().post(url, headers=headers, data=payload)
+
+        if response.status_code == 200:
+            result = response.json()
+            self.cache.set(cache_key, result, self.CACHE_TTL[data_for_search["search_type"]])
+            return result
+        else:
+            return "Error occurred while searching."
+
+    async def agoogle_search(self, data_for_search: dict = {}):
+        """Async version of `google_search` running on the shared pooled HTTP client."""
+        import asyncio
+        from dotcoder.tracing import annotate
+
+        request_data = self._build_request(data_for_search)
+        if isinstance(request_data, str):
+            return request_data
+
+        # The cache is SQLite behind a lock, so it runs off the event loop.
+        cache_key = self._cache_key(data_for_search)
+        cached = await asyncio.to_thread(self.cache.get, cache_key)
+        if cached is not None:
+            annotate(cache_hit=True)
+            return cached
+
+        from dotcoder.http_client import get_async_client
+
+        url, headers, payload = request_data
+        response = await get_async_client().post(url, headers=headers, content=payload)
+
+        if response.status_code == 200:
+            result = response.json()
+            await asyncio.to_thread(self.cache.set, cache_key, result, self.CACHE_TTL[data_for_search["search_type"]])
+            return result
+        else:
+            return "Error occurred while searching."
+
+    def _cache_key(self, data_for_search: dict) -> str:
+        import json
+
+        return json.dumps([data_for_search["search_type"], data_for_search["search_query"], data_for_search.get("k", 10)])
+
+    def _build_request(self, data_for_search: dict):
+        """Return the (url, headers, payload) of a Serper request, or an error message string."""
         search_categories = [
             "Search",
             "Images",
@@ -48,7 +129,6 @@ class GoogleSearchTool():
         if data_for_search["search_type"] not in search_categories:
             return f"Invalid search type. Choose from {search_categories}"
 
-        import requests
         import json
 
         if data_for_search["search_type"] == "Webpage":
@@ -71,9 +151,4 @@ class GoogleSearchTool():
             'Content-Type': 'application/json'
         }
 
-        response = requests.request("POST", url, headers=headers, data=payload)
-
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return "Error occurred while searching."
+        return url, headers, payload
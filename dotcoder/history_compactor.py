@@ -0,0 +1,151 @@
+import re
+import json
+import threading
+
+CODE_BLOCK_PATTERN = re.compile(r"```([\w+-]*)[^\n]*\n.*?```", re.DOTALL)
+
+
+def count_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token), good enough for budgeting without an API call."""
+    return len(text) // 4 + 1
+
+
+class HistoryCompactor:
+    def __init__(self, max_tokens: int = 30000, keep_last_turns: int = 6, summarizer=None, asummarizer=None):
+        """
+            Shrink a chat history to a token budget before it is passed to the agent.
+
+            Args:
+                max_tokens (int): Token budget of the whole history.
+                keep_last_turns (int): Number of most recent turns that are never summarized.
+                summarizer (callable): Optional `summarizer(conversation) -> str` used for older turns,
+                    e.g. ChatEnhancer.conversation_summary. Without it older turns are dropped.
+                asummarizer (callable): Optional async counterpart of `summarizer` used by `acompact`.
+        """
+        self.max_tokens = max_tokens
+        self.keep_last_turns = keep_last_turns
+        self.summarizer = summarizer
+        self.asummarizer = asummarizer
+
+        self._lock = threading.Lock()
+        self.compactions = 0
+        self.original_tokens = 0
+        self.compacted_tokens = 0
+        self.last_ratio = 1.0
+
+    # ********** Normalization **********
+
+    @staticmethod
+    def normalize(chat_history) -> list:
+        """
+            Turn any supported history format into a list of {"role", "content"} dicts.
+
+            Accepts (role, content) tuples, {"role", "content"} dicts, plain strings and the legacy
+            form field that holds the whole conversation as one JSON encoded string.
+        """
+        turns = []
+        for item in chat_history or []:
+            if isinstance(item, str):
+                try:
+                    decoded = json.loads(item)
+                except ValueError:
+                    decoded = None
+                if isinstance(decoded, list):
+                    turns.extend(HistoryCompactor.normalize(decoded))
+                else:
+                    turns.append({"role": "user", "content": item})
+            elif isinstance(item, dict):
+                turns.append({"role": item.get("role", "user"), "content": str(item.get("content", ""))})
+            elif isinstance(item, (tuple, list)) and len(item) == 2:
+                turns.append({"role": item[0], "content": str(item[1])})
+        return turns
+
+    # ********** Compaction Stages **********
+
+    @staticmethod
+    def collapse_code_versions(turns: list) -> list:
+        """Replace every code block that a later turn rewrote in the same language with a short note."""
+        seen_languages = set()
+        collapsed = []
+        for turn in reversed(turns):
+            def replace(match):
+                language = match.group(1).lower()
+                if language in seen_languages:
+                    return f"[earlier {language or 'code'} version omitted, superseded by a later version]"
+                return match.group(0)
+
+            content = CODE_BLOCK_PATTERN.sub(replace, turn["content"])
+            seen_languages.update(match.group(1).lower() for match in CODE_BLOCK_PATTERN.finditer(turn["content"]))
+            collapsed.append({"role": turn["role"], "content": content})
+        return list(reversed(collapsed))
+
+    @staticmethod
+    def tokens_of(turns: list) -> int:
+        return sum(count_tokens(turn["content"]) for turn in turns)
+
+    def _split(self, turns: list):
+        if len(turns) <= self.keep_last_turns:
+            return [], turns
+        return turns[:len(turns) - self.keep_last_turns], turns[len(turns) - self.keep_last_turns:]
+
+    def _fit(self, summary: str, recent: list) -> list:
+        turns = list(recent)
+        if summary:
+            turns.insert(0, {"role": "user", "content": f"Summary of our earlier conversation: {summary}"})
+        # The recent turns alone may still be over budget, drop the oldest but always keep the last one.
+        while len(turns) > 1 and self.tokens_of(turns) > self.max_tokens:
+            turns.pop(0)
+        return turns
+
+    def _record(self, original: int, compacted: int):
+        with self._lock:
+            self.compactions += 1
+            self.original_tokens += original
+            self.compacted_tokens += compacted
+            self.last_ratio = compacted / original if original else 1.0
+
+    @staticmethod
+    def as_messages(turns: list) -> list:
+        return [(turn["role"], turn["content"]) for turn in turns]
+
+    # ********** Public API **********
+
+    def compact(self, chat_history) -> list:
+        """Return the history as (role, content) tuples that fit into `max_tokens`."""
+        turns = self.normalize(chat_history)
+        original = self.tokens_of(turns)
+
+        if original > self.max_tokens:
+            turns = self.collapse_code_versions(turns)
+        if self.tokens_of(turns) > self.max_tokens:
+            older, recent = self._split(turns)
+            summary = self.summarizer(older) if older and self.summarizer else ""
+            turns = self._fit(summary, recent)
+
+        self._record(original, self.tokens_of(turns))
+        return self.as_messages(turns)
+
+    async def acompact(self, chat_history) -> list:
+        """Async version of `compact`, summarizes with `asummarizer`."""
+        turns = self.normalize(chat_history)
+        original = self.tokens_of(turns)
+
+        if original > self.max_tokens:
+            turns = self.collapse_code_versions(turns)
+        if self.tokens_of(turns) > self.max_tokens:
+            older, recent = self._split(turns)
+            summary = await self.asummarizer(older) if older and self.asummarizer else ""
+            turns = self._fit(summary, recent)
+
+        self._record(original, self.tokens_of(turns))
+        return self.as_messages(turns)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "compactions": self.compactions,
+                "original_tokens": self.original_tokens,
+                "compacted_tokens": self.compacted_tokens,
+                "compaction_ratio": self.compacted_tokens / self.original_tokens if self.original_tokens else 1.0,
+                "last_compaction_ratio": self.last_ratio,
+            }
@@ -0,0 +1,188 @@
+import asyncio
+import threading
+
+from dotcoder import metrics
+
+# Timeouts in seconds: (connect, read).
+DEFAULT_TIMEOUT = (10, 60)
+# Connections kept alive per host, requests beyond this wait for a free connection.
+MAX_CONNECTIONS_PER_HOST = 20
+
+_session = None
+_session_lock = threading.Lock()
+
+# One client per event loop, an httpx client cannot be shared between loops.
+_async_clients = {}
+_async_clients_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_host_stats = {}
+
+
+def _record(host: str, key: str):
+    with _stats_lock:
+        stats = _host_stats.setdefault(host, {"requests": 0, "connections": 0})
+        stats[key] += 1
+
+
+def stats() -> dict:
+    """Per-host request and new-connection counts, `reused` is the number of requests that used a kept-alive connection."""
+    with _stats_lock:
+        return {
+            host: dict(values, reused=max(values["requests"] - values["connections"], 0))
+            for host, values in _host_stats.items()
+        }
+
+
+metrics.register("http", stats, label="host")
+
+
+# ********** Sync HTTP Session **********
+
+def _counting_pool(pool_class):
+    class CountingConnectionPool(pool_class):
+        def _new_conn(self):
+            _record(self.host, "connections")
+            return super()._new_conn()
+
+    return CountingConnectionPool
+
+
+def _build_adapter():
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    from urllib3.util.retry import Retry
+
+    class PooledHTTPAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _counting_pool(HTTPConnectionPool),
+                "https": _counting_pool(HTTPSConnectionPool),
+            }
+
+        def send(self, request, **kwargs):
+            from urllib.parse import urlsplit
+
+            if kwargs.get("timeout") is None:
+                kwargs["timeout"] = DEFAULT_TIMEOUT
+            _record(urlsplit(request.url).hostname, "requests")
+            return super().send(request, **kwargs)
+
+    # Connection errors are retried for every method, status codes only for idempotent ones.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+        raise_on_status=False,
+    )
+    return PooledHTTPAdapter(pool_connections=16, pool_maxsize=MAX_CONNECTIONS_PER_HOST, pool_block=True, max_retries=retry)
+
+
+def get_session():
+    """Return the process-wide pooled requests.Session used for every outbound HTTP call."""
+    import requests
+
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = _build_adapter()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+class _SessionRequests:
+    """Stands in for the `requests` module, its request functions go through the pooled session."""
+
+    _VERBS = frozenset(["request", "get", "head", "options", "post", "put", "patch", "delete"])
+
+    def __getattr__(self, name):
+        if name in self._VERBS:
+            return getattr(get_session(), name)
+        import requests
+
+        return getattr(requests, name)
+
+
+def route_module_requests(module):
+    """
+        Send the `requests.post(...)`-style calls of a library module through the pooled session,
+        for libraries that only take a session for some of their clients.
+    """
+    module.requests = _SessionRequests()
+
+
+# ********** Async HTTP Client **********
+
+def get_async_client():
+    """Return the shared pooled httpx.AsyncClient of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    with _async_clients_lock:
+        entry = _async_clients.get(loop)
+        if entry is not None and not entry[0].is_closed:
+            return entry[0]
+
+        # Clients of loops closed without shutting down their async generators could not be closed on them,
+        # dropping them lets their connections be garbage collected.
+        for other in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[other]
+
+        client = _build_async_client()
+        lifetime = _async_client_lifetime(loop, client)
+        _async_clients[loop] = (client, lifetime)
+    # Started on the running loop, which then closes the client when it shuts down its async generators
+    # (asyncio.run does on exit), so a loop per request does not leak its connections.
+    try:
+        lifetime.asend(None).send(None)
+    except StopIteration:
+        pass
+    return client
+
+
+def _build_async_client():
+    import httpx
+
+    async def record_request(request):
+        host = request.url.host
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                _record(host, "connections")
+
+        _record(host, "requests")
+        request.extensions["trace"] = trace
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(DEFAULT_TIMEOUT[1], connect=DEFAULT_TIMEOUT[0]),
+        transport=httpx.AsyncHTTPTransport(
+            retries=3,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=MAX_CONNECTIONS_PER_HOST)
+        ),
+        event_hooks={"request": [record_request]},
+        follow_redirects=True
+    )
+
+
+async def _async_client_lifetime(loop, client):
+    try:
+        yield
+    finally:
+        with _async_clients_lock:
+            if _async_clients.get(loop, (None,))[0] is client:
+                del _async_clients[loop]
+        await client.aclose()
+
+
+async def aclose_async_client():
+    """Close the running loop's async client, called on ASGI shutdown."""
+    with _async_clients_lock:
+        entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        # Finishing its lifetime generator closes the client.
+        await entry[1].aclose()
@@ -0,0 +1,40 @@
+import threading
+
+
+class LazyObject:
+    """
+        Stand-in for a heavy singleton that is built by `factory()` on first attribute access.
+
+        Modules can keep exposing `auth = LazyObject(DotCoderAuth)` and callers use it as before,
+        while importing the module no longer pays for (or fails on) building the object.
+    """
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_instance", None)
+        object.__setattr__(self, "_lazy_lock", threading.Lock())
+
+    def _lazy_get(self):
+        instance = self._lazy_instance
+        if instance is None:
+            with self._lazy_lock:
+                instance = self._lazy_instance
+                if instance is None:
+                    instance = self._lazy_factory()
+                    object.__setattr__(self, "_lazy_instance", instance)
+        return instance
+
+    @property
+    def lazy_initialized(self) -> bool:
+        return self._lazy_instance is not None
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_get(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_get(), name, value)
+
+    def __repr__(self):
+        if self._lazy_instance is None:
+            return f"<LazyObject of {getattr(self._lazy_factory, '__name__', self._lazy_factory)} (not built)>"
+        return repr(self._lazy_instance)
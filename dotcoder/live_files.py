@@ -0,0 +1,280 @@
+import os
+import time
+import gzip
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+from werkzeug.security import safe_join
+
+from dotcoder import metrics
+from dotcoder.atomic_files import write_atomic
+
+LIVE_PROJECTS_DIRECTORY = "static/live_projects"
+
+# Precompressed variants written next to every published file, best first.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+# Reads of a file that keeps changing underneath the loader before it settles for the identity body alone.
+LOAD_ATTEMPTS = 3
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+def _compute_etag(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def project_version(code: str) -> str:
+    """ETag a project's code is served with, stored with the project so links can name the exact version."""
+    return _compute_etag(code.encode("utf-8"))
+
+
+def versioned_url(project: dict) -> str:
+    """
+        Link to the published version of a project, `?v=<etag>` makes it cacheable as immutable.
+        Projects published before versions were recorded keep their plain, revalidated URL.
+    """
+    url = (project or {}).get("url")
+    version = (project or {}).get("version")
+    return f"{url}?v={version}" if url and version else url
+
+
+# ********** Hot-Set Cache **********
+
+class LiveFileCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, revalidate_after: float = 10):
+        """
+            In-process LRU of published files keyed by their `/live/<url_path>`, holding every encoded
+            variant and the ETag so a hot project is served without touching the filesystem.
+
+            Args:
+                max_bytes (int): Budget for all cached variants together, 0 disables the cache.
+                revalidate_after (float): Seconds after which an entry's ETag is compared with the one on disk,
+                    so a republish done by another worker process is picked up.
+        """
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.views = Counter()
+        self.hits = Counter()
+
+    @staticmethod
+    def _size(entry: dict) -> int:
+        return sum(len(data) for data in entry["variants"].values())
+
+    def get(self, url_path: str):
+        with self._lock:
+            entry = self._entries.get(url_path)
+            if entry is not None:
+                self._entries.move_to_end(url_path)
+            return entry
+
+    def record_view(self, url_path: str, hit: bool):
+        """Count a view of an existing project, so the counters only grow with published projects."""
+        with self._lock:
+            self.views[url_path] += 1
+            if hit:
+                self.hits[url_path] += 1
+
+    def put(self, url_path: str, entry: dict):
+        size = self._size(entry)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(url_path, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+            self._entries[url_path] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= self._size(evicted)
+
+    def invalidate(self, url_path: str):
+        with self._lock:
+            old = self._entries.pop(url_path, None)
+            if old is not None:
+                self._bytes -= self._size(old)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def hot_projects(self, top: int = 20) -> dict:
+        """Views and cache hits of the `top` most viewed projects, keyed by their url path."""
+        with self._lock:
+            return {
+                url_path: {"views": views, "hits": self.hits[url_path]}
+                for url_path, views in self.views.most_common(top)
+            }
+
+
+live_file_cache = LiveFileCache(
+    max_bytes=int(os.getenv("LIVE_FILE_CACHE_BYTES", 64 * 1024 * 1024)),
+    revalidate_after=float(os.getenv("LIVE_FILE_CACHE_REVALIDATE", 10))
+)
+metrics.register("live_file_cache", live_file_cache.stats)
+metrics.register("live_file_project", live_file_cache.hot_projects, label="project")
+
+
+# ********** Publishing **********
+
+def write_live_project(username: str, project_url: str, code: str, directory: str = LIVE_PROJECTS_DIRECTORY):
+    """Write a published project with its gzip/brotli variants and ETag so every hit can be served as-is."""
+    user_directory = os.path.join(directory, username)
+    os.makedirs(user_directory, exist_ok=True)
+
+    html_path = os.path.join(user_directory, f"{project_url}.html")
+    data = code.encode("utf-8")
+
+    write_atomic(f"{html_path}.gz", gzip.compress(data, compresslevel=9, mtime=0))
+    brotli = _brotli()
+    if brotli is not None:
+        write_atomic(f"{html_path}.br", brotli.compress(data, quality=11))
+    elif os.path.exists(f"{html_path}.br"):
+        os.remove(f"{html_path}.br")
+    # A file only becomes visible once its variants exist, and its ETag sidecar is replaced after the
+    # body, so a revalidation never sees the new ETag next to the old content.
+    write_atomic(html_path, data)
+    write_atomic(f"{html_path}.etag", _compute_etag(data).encode("ascii"))
+    live_file_cache.invalidate(f"{username}/{project_url}")
+    return html_path
+
+
+def remove_live_project(username: str, project_url: str, directory: str = LIVE_PROJECTS_DIRECTORY):
+    html_path = os.path.join(directory, username, f"{project_url}.html")
+    for path in [html_path] + [f"{html_path}{suffix}" for _, suffix in ENCODINGS] + [f"{html_path}.etag"]:
+        if os.path.exists(path):
+            os.remove(path)
+    live_file_cache.invalidate(f"{username}/{project_url}")
+
+
+# ********** Serving **********
+
+def find_live_project(url_path: str, directory: str = LIVE_PROJECTS_DIRECTORY):
+    """Return the path of the published file for `/live/<url_path>`, or None."""
+    html_path = safe_join(directory, f"{url_path}.html")
+    if html_path is None or not os.path.isfile(html_path):
+        return None
+    return html_path
+
+
+def get_etag(html_path: str) -> str:
+    """Return the content ETag written at publish time, computing it for files published before ETags existed."""
+    try:
+        with open(f"{html_path}.etag", "r", encoding="ascii") as file:
+            return file.read().strip()
+    except OSError:
+        with open(html_path, "rb") as file:
+            etag = _compute_etag(file.read())
+        write_atomic(f"{html_path}.etag", etag.encode("ascii"))
+        return etag
+
+
+def _decompressors() -> dict:
+    brotli = _brotli()
+    decompressors = {"gzip": gzip.decompress}
+    if brotli is not None:
+        decompressors["br"] = brotli.decompress
+    return decompressors
+
+
+def _read_variants(html_path: str):
+    decompressors = _decompressors()
+    with open(html_path, "rb") as file:
+        variants = {None: file.read()}
+    complete = True
+    for encoding, suffix in ENCODINGS:
+        if encoding not in decompressors:
+            # Without the module the variant can be neither checked nor produced, so it is left out.
+            continue
+        try:
+            with open(f"{html_path}{suffix}", "rb") as file:
+                data = file.read()
+        except OSError:
+            continue
+        try:
+            matches = decompressors[encoding](data) == variants[None]
+        except Exception:
+            matches = False
+        # A variant from another publish than the body (read mid-publish) is never served with it.
+        if matches:
+            variants[encoding] = data
+        else:
+            complete = False
+    return variants, complete
+
+
+def load_live_project(url_path: str, directory: str = LIVE_PROJECTS_DIRECTORY):
+    """
+        Read a published file with its variants as {"etag", "variants": {encoding or None: bytes}}, or None.
+        The ETag is computed from the body actually read, and every variant is checked against that body.
+    """
+    html_path = find_live_project(url_path, directory)
+    if html_path is None:
+        return None
+
+    for _ in range(LOAD_ATTEMPTS):
+        variants, complete = _read_variants(html_path)
+        if complete:
+            break
+    return {"etag": _compute_etag(variants[None]), "variants": variants, "checked_at": time.time()}
+
+
+def get_live_project(url_path: str, directory: str = LIVE_PROJECTS_DIRECTORY):
+    """Return the published file for `/live/<url_path>` from the hot-set cache, loading it on a miss."""
+    entry = live_file_cache.get(url_path)
+
+    if entry is not None and time.time() - entry["checked_at"] > live_file_cache.revalidate_after:
+        html_path = find_live_project(url_path, directory)
+        if html_path is not None and get_etag(html_path) == entry["etag"]:
+            entry["checked_at"] = time.time()
+        else:
+            live_file_cache.invalidate(url_path)
+            entry = None
+
+    hit = entry is not None
+    if entry is None:
+        entry = load_live_project(url_path, directory)
+        if entry is not None:
+            live_file_cache.put(url_path, entry)
+
+    if entry is not None:
+        live_file_cache.record_view(url_path, hit)
+    return entry
+
+
+def select_encoding(variants: dict, accept_encodings):
+    """
+        Pick the best precompressed variant the client accepts.
+
+        Args:
+            variants (dict): The variants of a published file, keyed by encoding.
+            accept_encodings: werkzeug's `request.accept_encodings`.
+
+        Returns:
+            The encoding to send, None for the uncompressed file.
+    """
+    for encoding, _ in ENCODINGS:
+        if encoding in variants and accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Strong ETags must differ between encodings of the same content."""
+    return f"{etag}-{encoding}" if encoding else etag
@@ -0,0 +1,110 @@
+import re
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger("dotcoder.metrics")
+
+# Upper bounds in seconds, from a cache hit to a long agent run.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_lock = threading.Lock()
+_spans = {}
+_sources = {}
+
+
+def observe_span(name: str, seconds: float, error: bool = False):
+    """Count a finished span in the duration histogram of its name."""
+    with _lock:
+        histogram = _spans.get(name)
+        if histogram is None:
+            histogram = _spans[name] = {"buckets": [0] * (len(DURATION_BUCKETS) + 1), "sum": 0.0, "count": 0, "errors": 0}
+        histogram["buckets"][bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+        if error:
+            histogram["errors"] += 1
+
+
+def register(name: str, source, label: str = None):
+    """
+        Expose the numeric values of a stats() dict as `dotcoder_<name>_<key>` gauges.
+
+        Args:
+            name (str): Metric prefix, registering a name again replaces its source.
+            source (callable): Returns the stats dict, or None while its owner has not been built.
+            label (str): When set, `source()` maps label values (a host, a tool) to stats dicts.
+    """
+    with _lock:
+        _sources[name] = (source, label)
+
+
+def _metric_name(*parts) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(("dotcoder",) + parts))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _add_values(samples: dict, name: str, values: dict, labels: dict):
+    # Only flat numbers are exported, lists and nested dicts (top projects, error types) stay in stats().
+    for key, value in values.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            samples.setdefault(_metric_name(name, key), []).append((labels, value))
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        spans = {name: dict(histogram, buckets=list(histogram["buckets"])) for name, histogram in _spans.items()}
+        sources = sorted(_sources.items())
+
+    lines = [
+        "# HELP dotcoder_span_duration_seconds Duration of traced operations.",
+        "# TYPE dotcoder_span_duration_seconds histogram",
+    ]
+    for name, histogram in sorted(spans.items()):
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + (float("inf"),), histogram["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"dotcoder_span_duration_seconds_bucket{_labels({'span': name, 'le': le})} {cumulative}")
+        lines.append(f"dotcoder_span_duration_seconds_sum{_labels({'span': name})} {histogram['sum']!r}")
+        lines.append(f"dotcoder_span_duration_seconds_count{_labels({'span': name})} {histogram['count']}")
+
+    lines += [
+        "# HELP dotcoder_span_errors_total Traced operations that ended with an error.",
+        "# TYPE dotcoder_span_errors_total counter",
+    ]
+    lines += [f"dotcoder_span_errors_total{_labels({'span': name})} {histogram['errors']}" for name, histogram in sorted(spans.items())]
+
+    samples = {}
+    for name, (source, label) in sources:
+        try:
+            stats = source()
+        except Exception as e:
+            logger.warning("Collecting %s stats failed: %s", name, e)
+            continue
+        if not stats:
+            continue
+        if label is None:
+            _add_values(samples, name, stats, {})
+        else:
+            for label_value, values in stats.items():
+                if isinstance(values, dict):
+                    _add_values(samples, name, values, {label: label_value})
+
+    for metric, values in samples.items():
+        lines.append(f"# TYPE {metric} gauge")
+        lines += [f"{metric}{_labels(labels)} {value!r}" for labels, value in values]
+
+    return "\n".join(lines) + "\n"
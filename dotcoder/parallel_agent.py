@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from langchain.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentStep
+
+from dotcoder.agent_context import current_run
+
+# Shared by every agent run, so concurrent chats cannot start an unbounded number of tool threads.
+_tool_pool = ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_TOOL_WORKERS", 16)))
+
+# Actions planned in the current agent step, set while the base class iterates over them.
+_step_actions = contextvars.ContextVar("dotcoder_step_actions", default=None)
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """
+        AgentExecutor that runs the tool calls of one step concurrently.
+
+        The async path already gathers them, the sync path runs them on a shared thread pool. In both,
+        at most `max_parallel_tools` calls of a step run at once and each call is capped by its timeout,
+        an expired call becomes an observation the model can react to. Steps are returned in the order
+        the model issued the calls, so the scratchpad is deterministic.
+    """
+
+    max_parallel_tools: int = 4
+    default_tool_timeout: float = 60.0
+    # Per-tool overrides of `default_tool_timeout`, keyed by tool name.
+    tool_timeouts: dict = {}
+
+    def _tool_timeout(self, agent_action: AgentAction) -> float:
+        return self.tool_timeouts.get(agent_action.tool, self.default_tool_timeout)
+
+    @staticmethod
+    def _timed_out(agent_action: AgentAction, timeout: float) -> AgentStep:
+        run = current_run()
+        if run is not None:
+            run.count("tool_errors")
+            run.log(logging.WARNING, "tool_timeout", tool=agent_action.tool, timeout_s=timeout)
+        return AgentStep(action=agent_action, observation=f"{agent_action.tool} timed out after {timeout:g} seconds.")
+
+    # ********** Sync **********
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # The base class yields every planned action before it performs the first one, so when
+        # `_perform_agent_action` is called the whole step is known and can be started at once.
+        step = {"actions": [], "calls": None}
+        token = _step_actions.set(step)
+        try:
+            for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                if isinstance(item, AgentAction):
+                    step["actions"].append(item)
+                yield item
+        finally:
+            _step_actions.reset(token)
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        step = _step_actions.get()
+        if step is None or not any(action is agent_action for action in step["actions"]):
+            step = {"actions": [agent_action], "calls": None}
+
+        if step["calls"] is None:
+            semaphore = threading.BoundedSemaphore(self.max_parallel_tools)
+            step["calls"] = [
+                self._submit_action(name_to_tool_map, color_mapping, action, run_manager, semaphore)
+                for action in step["actions"]
+            ]
+
+        index = next(i for i, action in enumerate(step["actions"]) if action is agent_action)
+        future, call = step["calls"][index]
+        timeout = self._tool_timeout(agent_action)
+
+        # The timeout counts from the moment the tool starts, not while it waits for a free slot.
+        while True:
+            started = call["started"]
+            remaining = timeout if started is None else started + timeout - time.monotonic()
+            try:
+                return future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                if call["started"] is not None and time.monotonic() >= call["started"] + timeout:
+                    return self._timed_out(agent_action, timeout)
+
+    def _submit_action(self, name_to_tool_map, color_mapping, agent_action, run_manager, semaphore):
+        perform = super()._perform_agent_action
+        call = {"started": None}
+
+        def run():
+            with semaphore:
+                call["started"] = time.monotonic()
+                return perform(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+        return _tool_pool.submit(contextvars.copy_context().run, run), call
+
+    # ********** Async **********
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # The base class gathers the step's actions as tasks, which inherit this context and its semaphore.
+        token = _step_actions.set({"semaphore": asyncio.Semaphore(self.max_parallel_tools)})
+        try:
+            async for item in super()._aiter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                yield item
+        finally:
+            _step_actions.reset(token)
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        step = _step_actions.get()
+        semaphore = step["semaphore"] if step and "semaphore" in step else asyncio.Semaphore(1)
+        timeout = self._tool_timeout(agent_action)
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager),
+                    timeout
+                )
+            except asyncio.TimeoutError:
+                return self._timed_out(agent_action, timeout)
@@ -0,0 +1,41 @@
+import contextvars
+
+# Holds a dict while a request is being handled, None outside of one.
+_memo = contextvars.ContextVar("dotcoder_request_memo", default=None)
+
+
+def begin():
+    """Start a fresh memo for the current request, called from the framework's before-request hook."""
+    _memo.set({})
+
+
+def end():
+    _memo.set(None)
+
+
+def memoized(key, func, *args):
+    """
+        Return `func(*args)`, computed at most once per request for `key`.
+        Outside of a request, or when `func` returns None (a failed lookup), nothing is remembered.
+    """
+    memo = _memo.get()
+    if memo is None:
+        return func(*args)
+    if key in memo:
+        return memo[key]
+
+    value = func(*args)
+    if value is not None:
+        memo[key] = value
+    return value
+
+
+def forget(*keys):
+    """Drop memoized values after a write made them stale, no keys drops everything."""
+    memo = _memo.get()
+    if memo is None:
+        return
+    if not keys:
+        memo.clear()
+    for key in keys:
+        memo.pop(key, None)
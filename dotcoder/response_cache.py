@@ -0,0 +1,122 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, disk_path: str = None):
+        """
+            Two-tier cache for JSON-serializable responses: an in-memory LRU bounded by size and an
+            optional SQLite file that survives restarts.
+
+            Args:
+                max_bytes (int): Memory budget of the LRU, measured on the JSON encoded values.
+                disk_path (str): Optional SQLite file used as the second tier.
+        """
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._conn = None
+        if disk_path:
+            import sqlite3
+
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+
+    # ********** Memory Tier **********
+
+    def _memory_set(self, key: str, encoded: str, expires_at: float):
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old[1])
+        self._entries[key] = (expires_at, encoded)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _memory_get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, encoded = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self._bytes -= len(encoded)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    # ********** Public API **********
+
+    def get(self, key: str):
+        """Return the cached value for `key`, or None on a miss."""
+        with self._lock:
+            entry = self._memory_get(key)
+            if entry is not None:
+                self.memory_hits += 1
+                return json.loads(entry[1])
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?", (key, time.time())
+                ).fetchone()
+                if row is not None:
+                    self._memory_set(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value, ttl: float):
+        """Store `value` for `ttl` seconds in memory and, if configured, on disk."""
+        if ttl <= 0:
+            return
+        encoded = json.dumps(value)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._memory_set(key, encoded, expires_at)
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, encoded, expires_at)
+                    )
+                    self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._conn is not None:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            total = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
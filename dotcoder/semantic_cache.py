@@ -0,0 +1,161 @@
+import re
+import math
+import time
+import threading
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace, so trivially different prompts share a key."""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", (text or "").lower())).strip()
+
+
+def _unit(vector) -> list:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else None
+
+
+class SemanticResponseCache:
+    def __init__(self, embedder=None, threshold: float = 0.92, ttl: float = 24 * 3600, max_entries: int = 500, max_history_turns: int = 0):
+        """
+            Agent responses for first-turn (or short-history) prompts, reused for identical or very similar prompts.
+
+            Args:
+                embedder: Object with `embed_query(text)` and `aembed_query(text)`, e.g. GoogleGenerativeAIEmbeddings.
+                    Without it only prompts that normalize to the same text match.
+                threshold (float): Minimum cosine similarity for a cached response to be reused.
+                ttl (float): Seconds a response is served.
+                max_entries (int): Size of the LRU index.
+                max_history_turns (int): Longest chat history that is still looked up, 0 for first turns only.
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_history_turns = max_history_turns
+
+        # key -> {"embedding", "response", "expires_at"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.embedding_errors = 0
+
+    # ********** Keys **********
+
+    def eligible(self, query: str, chat_history: list) -> bool:
+        return bool(query) and len(chat_history or []) <= self.max_history_turns
+
+    @staticmethod
+    def _key(query: str, chat_history: list) -> str:
+        parts = []
+        for turn in chat_history or []:
+            if isinstance(turn, dict):
+                parts.append(f"{turn.get('role', 'user')}: {normalize_prompt(str(turn.get('content', '')))}")
+            elif isinstance(turn, (tuple, list)) and len(turn) == 2:
+                parts.append(f"{turn[0]}: {normalize_prompt(str(turn[1]))}")
+            else:
+                parts.append(normalize_prompt(str(turn)))
+        parts.append(normalize_prompt(query))
+        return "\n".join(parts)
+
+    # ********** Index **********
+
+    def _match(self, key: str, embedding):
+        now = time.time()
+        with self._lock:
+            for expired in [entry_key for entry_key, entry in self._entries.items() if entry["expires_at"] <= now]:
+                del self._entries[expired]
+
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["response"]
+
+            if embedding is not None:
+                best_key, best_score = None, self.threshold
+                for entry_key, entry in self._entries.items():
+                    if entry["embedding"] is None:
+                        continue
+                    score = sum(a * b for a, b in zip(embedding, entry["embedding"]))
+                    if score >= best_score:
+                        best_key, best_score = entry_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]["response"]
+
+            self.misses += 1
+            return None
+
+    def _embed(self, key: str):
+        if self.embedder is None:
+            return None
+        try:
+            return _unit(self.embedder.embed_query(key))
+        except Exception:
+            with self._lock:
+                self.embedding_errors += 1
+            return None
+
+    async def _aembed(self, key: str):
+        if self.embedder is None:
+            return None
+        try:
+            return _unit(await self.embedder.aembed_query(key))
+        except Exception:
+            with self._lock:
+                self.embedding_errors += 1
+            return None
+
+    # ********** Public API **********
+
+    def lookup(self, query: str, chat_history: list = None):
+        """
+            Return (response, probe). `response` is the cached output or None, pass `probe` to `store`
+            after a miss so the prompt is not embedded twice.
+        """
+        key = self._key(query, chat_history)
+        with self._lock:
+            exact = key in self._entries and self._entries[key]["expires_at"] > time.time()
+        embedding = None if exact else self._embed(key)
+        return self._match(key, embedding), (key, embedding)
+
+    async def alookup(self, query: str, chat_history: list = None):
+        key = self._key(query, chat_history)
+        with self._lock:
+            exact = key in self._entries and self._entries[key]["expires_at"] > time.time()
+        embedding = None if exact else await self._aembed(key)
+        return self._match(key, embedding), (key, embedding)
+
+    def store(self, probe, response: str):
+        if not response:
+            return
+        key, embedding = probe
+        with self._lock:
+            self._entries[key] = {"embedding": embedding, "response": response, "expires_at": time.time() + self.ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "embedding_errors": self.embedding_errors,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / total if total else 0.0,
+            }
@@ -0,0 +1,55 @@
+import time
+import threading
+
+
+class SingleFlight:
+    def __init__(self, result_ttl: float = 30):
+        """
+            Run a call once per key while other callers with the same key wait for its result.
+
+            Args:
+                result_ttl (float): Seconds a finished result is still handed to late callers with the same key.
+        """
+        self.result_ttl = result_ttl
+
+        self._calls = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """Call `func(*args, **kwargs)` unless a call for `key` is already running or just finished."""
+        with self._lock:
+            self._drop_expired()
+
+            if key in self._results:
+                return self._results[key][1]
+
+            call = self._calls.get(key)
+            if call is None:
+                call = {"event": threading.Event(), "result": None}
+                self._calls[key] = call
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call["event"].wait()
+            return call["result"]
+
+        result = None
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            with self._lock:
+                call["result"] = result
+                del self._calls[key]
+                if result is not None:
+                    self._results[key] = (time.time() + self.result_ttl, result)
+            call["event"].set()
+
+        return result
+
+    def _drop_expired(self):
+        now = time.time()
+        for key in [key for key, (expires_at, _) in self._results.items() if expires_at <= now]:
+            del self._results[key]
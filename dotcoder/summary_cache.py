@@ -0,0 +1,71 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class SummaryCache:
+    def __init__(self, max_entries: int = 1000):
+        """
+            LRU of conversation summaries keyed by a chained hash of the turns they cover.
+
+            Turn i is hashed together with the hash of turns 0..i-1, so looking up a conversation
+            finds the summary of its longest already summarized prefix and only the turns after
+            it need to be folded in.
+        """
+        self.max_entries = max_entries
+
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def prefix_keys(turns: list) -> list:
+        """Return the key of every prefix, keys[i] covers turns[:i + 1]."""
+        keys = []
+        digest = b""
+        for turn in turns:
+            hasher = hashlib.sha256(digest)
+            hasher.update(turn["role"].encode("utf-8"))
+            hasher.update(b"\0")
+            hasher.update(turn["content"].encode("utf-8"))
+            digest = hasher.digest()
+            keys.append(digest.hex())
+        return keys
+
+    def lookup(self, turns: list):
+        """Return (covered, summary) for the longest cached prefix of `turns`, (0, None) if there is none."""
+        keys = self.prefix_keys(turns)
+        with self._lock:
+            for covered in range(len(keys), 0, -1):
+                summary = self._summaries.get(keys[covered - 1])
+                if summary is not None:
+                    self._summaries.move_to_end(keys[covered - 1])
+                    if covered == len(keys):
+                        self.hits += 1
+                    else:
+                        self.partial_hits += 1
+                    return covered, summary
+            self.misses += 1
+            return 0, None
+
+    def set(self, turns: list, summary: str):
+        if not turns or not summary:
+            return
+        key = self.prefix_keys(turns)[-1]
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.max_entries:
+                self._summaries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._summaries),
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,106 @@
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class TokenCache:
+    def __init__(self, ttl: int = 300, max_size: int = 10000):
+        """
+            Keep verified ID tokens in memory so a session check does not need a Firebase round trip.
+
+            Args:
+                ttl (int): Maximum number of seconds an entry is trusted before it is verified again.
+                max_size (int): Maximum number of tokens kept, the least recently used one is dropped first.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    # ********** Helpers **********
+
+    @staticmethod
+    def _key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _token_expiry(token: str):
+        """Read the `exp` claim of a JWT without verifying it, the token was already verified by Firebase."""
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except Exception:
+            return None
+
+    # ********** Cache Operations **********
+
+    def get(self, token: str):
+        """Return the cached account info for a token, or None if it is missing or expired."""
+        if not token:
+            return None
+
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, account_info = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return account_info
+
+    def set(self, token: str, account_info: dict):
+        """Store the account info of a verified token until the TTL or the token's own expiry, whichever is first."""
+        if not token or account_info is None:
+            return
+
+        expires_at = time.time() + self.ttl
+        token_expiry = self._token_expiry(token)
+        if token_expiry is not None:
+            expires_at = min(expires_at, token_expiry)
+
+        if expires_at <= time.time():
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, account_info)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        """Drop a token from the cache, e.g. on sign-out."""
+        if not token:
+            return
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0,
+            }
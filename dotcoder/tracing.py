@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import queue
+import atexit
+import inspect
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+
+from dotcoder import metrics
+
+logger = logging.getLogger("dotcoder.tracing")
+
+# Every span is counted in the /metrics histograms. TRACE_EXPORT=jsonl also appends finished spans to
+# TRACE_FILE and TRACE_EXPORT=otlp posts them to an OpenTelemetry collector (OTLP/HTTP JSON).
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or (
+    os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318").rstrip("/") + "/v1/traces"
+)
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "dotcoder")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", 10000))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", 512))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", 5))
+
+_SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+# The span the current thread or task is working in, new spans become its children.
+_current_span = contextvars.ContextVar("dotcoder_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: str = None, kind: str = "internal", attributes: dict = None):
+        """
+            One timed operation. Ended spans are counted in the metrics and handed to the exporter.
+
+            Args:
+                name (str): Operation name, also the `span` label of the duration histogram, so keep it low-cardinality.
+                trace_id (str): 32 hex digits shared by every span of a request.
+                parent_id (str): Span id of the parent, None for a root span.
+                kind (str): "internal", "server" or "client".
+                attributes (dict): Initial attributes, more can be added with `set`.
+        """
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.duration_ns = None
+        self.error = None
+        self._started = time.perf_counter_ns()
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header that makes a downstream service continue this trace."""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.error = f"{type(error).__name__}: {error}"[:500] if isinstance(error, BaseException) else str(error)[:500]
+
+    def end(self, error: BaseException = None):
+        if self.duration_ns is not None:
+            return
+        self.duration_ns = time.perf_counter_ns() - self._started
+        if error is not None:
+            self.fail(error)
+        metrics.observe_span(self.name, self.duration_ns / 1e9, self.error is not None)
+        if TRACE_EXPORT:
+            _export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "kind": self.kind,
+            "start_time_unix_nano": self.start_ns,
+            "duration_ms": round(self.duration_ns / 1e6, 3) if self.duration_ns is not None else None,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": _SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.start_ns + (self.duration_ns or 0)),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items() if value is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _parse_traceparent(header: str):
+    parts = (header or "").strip().lower().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[1] == "0" * 32:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2]
+
+
+# ********** Spans **********
+
+def current_span():
+    """Return the span the current thread or task is working in, or None."""
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Add attributes (a cache hit, a result size) to the current span, if there is one."""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def start_span(name: str, parent: Span = None, kind: str = "internal", traceparent: str = None, **attributes) -> Span:
+    """
+        Start a span under `parent`, else under the current span, else under the remote parent of a
+        W3C `traceparent` header, else as the root of a new trace. It has to be ended with `end()`.
+    """
+    parent = parent or _current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = _parse_traceparent(traceparent) or (os.urandom(16).hex(), None)
+    return Span(name, trace_id, parent_id, kind, attributes)
+
+
+def activate(span: Span):
+    """Make `span` the current span, returns the token for `deactivate`."""
+    return _current_span.set(span)
+
+
+def deactivate(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Reset from another context (e.g. a stream closed by a dropped client), the variable dies with that context.
+        pass
+
+
+@contextlib.contextmanager
+def span(name: str, kind: str = "internal", traceparent: str = None, **attributes):
+    """Time the block as a child of the current span, exceptions raised in it mark the span as failed."""
+    current = start_span(name, kind=kind, traceparent=traceparent, **attributes)
+    token = activate(current)
+    try:
+        yield current
+    except Exception as e:
+        current.end(e)
+        raise
+    finally:
+        deactivate(token)
+        current.end()
+
+
+def traced(name: str, kind: str = "internal"):
+    """Decorator that runs each call of a function or coroutine function in a span called `name`."""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def arun(*args, **kwargs):
+                with span(name, kind):
+                    return await func(*args, **kwargs)
+            return arun
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with span(name, kind):
+                return func(*args, **kwargs)
+        return run
+
+    return decorate
+
+
+def trace_methods(prefix: str, include: tuple = ()):
+    """Class decorator that traces every public method, and the private ones in `include`, as `<prefix>.<method>`."""
+    def decorate(cls):
+        for name, value in list(vars(cls).items()):
+            if inspect.isfunction(value) and (not name.startswith("_") or name in include):
+                setattr(cls, name, traced(f"{prefix}.{name}")(value))
+        return cls
+
+    return decorate
+
+
+# ********** Export **********
+
+_export_lock = threading.Lock()
+_export_queue = None
+_export_pid = None
+_export_stats = {"exported": 0, "dropped": 0, "failed": 0}
+
+
+def _count_export(key: str, amount: int):
+    with _export_lock:
+        _export_stats[key] += amount
+
+
+def export_stats() -> dict:
+    """Spans written by the exporter, `dropped` did not fit in the queue and `failed` could not be written."""
+    with _export_lock:
+        return dict(_export_stats, queued=_export_queue.qsize() if _export_queue is not None else 0)
+
+
+def _export(span: Span):
+    # Request threads only enqueue, a background thread writes the spans in batches.
+    try:
+        _exporter_queue().put_nowait(span)
+    except queue.Full:
+        _count_export("dropped", 1)
+
+
+def _exporter_queue():
+    global _export_queue, _export_pid
+    if _export_pid != os.getpid():
+        with _export_lock:
+            if _export_pid != os.getpid():
+                # Started on first use in each process, so forked workers get their own writer thread.
+                _export_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+                threading.Thread(target=_export_loop, args=(_export_queue,), name="dotcoder-trace-export", daemon=True).start()
+                _export_pid = os.getpid()
+    return _export_queue
+
+
+def _export_loop(spans: queue.Queue):
+    # A batch is written when it is full, TRACE_EXPORT_INTERVAL after its first span, or when `flush` asks for it.
+    batch, deadline = [], None
+    while True:
+        try:
+            item = spans.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            item = None
+        if isinstance(item, Span):
+            batch.append(item)
+            deadline = deadline or time.monotonic() + TRACE_EXPORT_INTERVAL
+            if len(batch) < TRACE_BATCH_SIZE:
+                continue
+        if batch:
+            _write_batch(batch)
+            batch, deadline = [], None
+        if isinstance(item, threading.Event):
+            item.set()
+
+
+def _write_batch(batch: list):
+    try:
+        if TRACE_EXPORT == "otlp":
+            from dotcoder.http_client import get_session
+
+            payload = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "dotcoder"}, "spans": [span.to_otlp() for span in batch]}],
+            }]}
+            get_session().post(OTLP_ENDPOINT, json=payload, timeout=10).raise_for_status()
+        else:
+            with open(TRACE_FILE, "a", encoding="utf-8") as file:
+                file.write("".join(json.dumps(span.to_dict(), default=str) + "\n" for span in batch))
+        _count_export("exported", len(batch))
+    except Exception as e:
+        _count_export("failed", len(batch))
+        logger.warning("Exporting %d spans failed: %s", len(batch), e)
+
+
+@atexit.register
+def flush(timeout: float = 5):
+    """Wait until the exporter has written every span ended so far, runs at interpreter exit."""
+    if _export_queue is None or _export_pid != os.getpid():
+        return
+    written = threading.Event()
+    try:
+        _export_queue.put(written, timeout=timeout)
+    except queue.Full:
+        return
+    written.wait(timeout)
+
+
+metrics.register("trace_export", lambda: export_stats() if TRACE_EXPORT else None)
@@ -0,0 +1,213 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+
+from dotcoder.atomic_files import write_atomic
+
+
+class ContentTruncator:
+    def __init__(self, max_bytes: int, max_lines: int):
+        """
+            Collect a streamed body and stop once `max_bytes` or `max_lines` is reached, so a huge
+            file is never fully read into memory.
+        """
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+
+        self.parts = []
+        self.size = 0
+        self.lines = 0
+        self.truncated = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add a chunk, return True once a limit is reached and the rest of the body can be dropped."""
+        if self.truncated or not chunk:
+            return self.truncated
+
+        if self.size + len(chunk) > self.max_bytes:
+            chunk = chunk[:self.max_bytes - self.size]
+            self.truncated = True
+
+        newlines = chunk.count(b"\n")
+        if self.lines + newlines >= self.max_lines:
+            index = -1
+            for _ in range(self.max_lines - self.lines):
+                index = chunk.index(b"\n", index + 1)
+            chunk = chunk[:index]
+            self.lines = self.max_lines
+            self.truncated = True
+        else:
+            self.lines += newlines
+
+        self.parts.append(chunk)
+        self.size += len(chunk)
+        return self.truncated
+
+    def text(self) -> str:
+        # A byte cut can split a multi-byte character, ignore the incomplete tail.
+        return b"".join(self.parts).decode("utf-8", errors="ignore")
+
+
+class UrlContentCache:
+    def __init__(self, directory: str = ".cache/url_content", max_bytes: int = 256 * 1024 * 1024, max_age: float = 7 * 24 * 3600):
+        """
+            Disk cache of fetched URL content with the validators needed for conditional GETs.
+
+            Bodies are stored once per content hash under `directory/blobs`, so the same file served
+            from several URLs (branches, forks, mirrors) is kept a single time. Entries unused for
+            `max_age` seconds are dropped, then the least recently used ones until the stored bodies
+            fit in `max_bytes`.
+        """
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self._conn = sqlite3.connect(os.path.join(directory, "index.sqlite3"), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "url TEXT PRIMARY KEY, "
+                "etag TEXT, "
+                "last_modified TEXT, "
+                "content_hash TEXT NOT NULL, "
+                "fetched_at REAL NOT NULL, "
+                "size INTEGER NOT NULL DEFAULT 0, "
+                "used_at REAL NOT NULL DEFAULT 0)"
+            )
+            self._migrate()
+            self._conn.execute("CREATE INDEX IF NOT EXISTS urls_used_at ON urls (used_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS urls_content_hash ON urls (content_hash)")
+            self._bytes = self._stored_bytes()
+
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _migrate(self):
+        # Indexes written before entries had a size and a last use get both from their blob and fetch time.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(urls)")}
+        if "size" in columns:
+            return
+        self._conn.execute("ALTER TABLE urls ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute("ALTER TABLE urls ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        for url, content_hash in self._conn.execute("SELECT url, content_hash FROM urls").fetchall():
+            try:
+                size = os.path.getsize(self._blob_path(content_hash))
+            except OSError:
+                size = 0
+            self._conn.execute("UPDATE urls SET size = ?, used_at = fetched_at WHERE url = ?", (size, url))
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self.blob_directory, f"{content_hash}.txt")
+
+    def _stored_bytes(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM urls GROUP BY content_hash)"
+        ).fetchone()[0]
+
+    def conditional_headers(self, url: str) -> dict:
+        """Return If-None-Match / If-Modified-Since headers for a cached URL, empty if it is not cached."""
+        with self._lock:
+            row = self._conn.execute("SELECT etag, last_modified, content_hash FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None or not os.path.exists(self._blob_path(row[2])):
+            return {}
+
+        headers = {}
+        if row[0]:
+            headers["If-None-Match"] = row[0]
+        if row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def get(self, url: str):
+        """Return the cached content of `url` after a 304 response, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM urls WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(self._blob_path(row[0]), "r", encoding="utf-8") as file:
+                content = file.read()
+        except OSError:
+            return None
+        with self._lock, self._conn:
+            self.revalidated += 1
+            self._conn.execute("UPDATE urls SET used_at = ? WHERE url = ?", (time.time(), url))
+        return content
+
+    def set(self, url: str, content: str, etag: str = None, last_modified: str = None):
+        """Store content fetched with a 200 response. Without validators there is nothing to revalidate, so it is skipped."""
+        if not etag and not last_modified:
+            with self._lock:
+                self.misses += 1
+            return
+
+        data = content.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            write_atomic(blob_path, data)
+
+        now = time.time()
+        with self._lock, self._conn:
+            self.misses += 1
+            previous = self._conn.execute("SELECT content_hash FROM urls WHERE url = ?", (url,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO urls (url, etag, last_modified, content_hash, fetched_at, size, used_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content_hash, now, len(data), now)
+            )
+            # The URL's old body is deleted once no other URL refers to it.
+            if previous is not None and previous[0] != content_hash:
+                self._remove_unreferenced_blobs({previous[0]})
+            self._bytes = self._stored_bytes()
+            self._prune(now)
+
+    def _prune(self, now: float):
+        # Runs with the lock held, right after a write.
+        victims = self._conn.execute(
+            "SELECT url, content_hash, size FROM urls WHERE used_at < ?", (now - self.max_age,)
+        ).fetchall()
+        excess = self._bytes - self.max_bytes - sum(size for _, _, size in victims)
+        if excess > 0:
+            for url, content_hash, size in self._conn.execute(
+                "SELECT url, content_hash, size FROM urls WHERE used_at >= ? ORDER BY used_at", (now - self.max_age,)
+            ).fetchall():
+                if excess <= 0:
+                    break
+                victims.append((url, content_hash, size))
+                excess -= size
+        if not victims:
+            return
+
+        self._conn.executemany("DELETE FROM urls WHERE url = ?", [(url,) for url, _, _ in victims])
+        self._remove_unreferenced_blobs({content_hash for _, content_hash, _ in victims})
+        self.evictions += len(victims)
+        self._bytes = self._stored_bytes()
+
+    def _remove_unreferenced_blobs(self, content_hashes: set):
+        for content_hash in content_hashes:
+            if self._conn.execute("SELECT 1 FROM urls WHERE content_hash = ? LIMIT 1", (content_hash,)).fetchone() is None:
+                try:
+                    os.remove(self._blob_path(content_hash))
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            blobs = self._conn.execute("SELECT COUNT(DISTINCT content_hash), COUNT(*) FROM urls").fetchone()
+            total = self.revalidated + self.misses
+            return {
+                "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": self.revalidated / total if total else 0.0,
+                "urls": blobs[1],
+                "unique_contents": blobs[0],
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
@@ -1,49 +1,299 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-# from langchain_groq import ChatGroq
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.agents import create_tool_calling_agent, AgentExecutor
+import os
+import threading
+import functools
+import contextvars
+from queue import Queue
 
-from dotcoder.dotcoder_tools import google_search_tool, get_content_from_url_tool, github_code_url_search_tool
+from dotcoder import metrics
+from dotcoder.lazy import LazyObject
+from dotcoder.chat_enhancer import ChatEnhancer
+from dotcoder.history_compactor import HistoryCompactor
+from dotcoder.semantic_cache import SemanticResponseCache
+from dotcoder.agent_context import AgentRunContext, configure_logging, logger
 
-with open("system_prompt.txt", "r") as file:
-    system_prompt = file.read()
+# The LLM clients, the agent and its tools are built on first use, so importing this module is cheap
+# and does not need any API key.
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
 
-# llm = ChatGroq(model="deepseek-r1-distill-llama-70b")
+@functools.lru_cache(maxsize=None)
+def get_system_prompt() -> str:
+    with open("system_prompt.txt", "r") as file:
+        return file.read()
 
-prompt = ChatPromptTemplate.from_messages([
-    ("system", "{system_prompt}"),
-    ("placeholder", "{chat_history}"),
-    ("human", "{query}"),
-    ("placeholder", "{agent_scratchpad}")
-])
 
-chat_history = []
+def _build_agent_executor():
+    # from langchain_groq import ChatGroq
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain.prompts import ChatPromptTemplate
+    from langchain.agents import create_tool_calling_agent
 
-tools = [
-    google_search_tool,
-    get_content_from_url_tool,
-    github_code_url_search_tool
-]
+    from dotcoder.dotcoder_tools import google_search_tool, get_content_from_url_tool, github_code_url_search_tool
+    from dotcoder.parallel_agent import ParallelAgentExecutor
+
+    llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+
+    # llm = ChatGroq(model="deepseek-r1-distill-llama-70b")
+
+    prompt = ChatPromptTemplate.from_messages([
+        ("system", "{system_prompt}"),
+        ("placeholder", "{chat_history}"),
+        ("human", "{query}"),
+        ("placeholder", "{agent_scratchpad}")
+    ])
+
+    tools = [
+        google_search_tool,
+        get_content_from_url_tool,
+        github_code_url_search_tool
+    ]
+
+    agent = create_tool_calling_agent(
+        llm=llm,
+        prompt=prompt, 
+        tools=tools
+    )
+
+    # Tool calls of one step run concurrently, each bounded by its timeout, and a run stops after
+    # AGENT_MAX_ITERATIONS steps or AGENT_MAX_EXECUTION_TIME seconds.
+    return ParallelAgentExecutor(
+        agent=agent,
+        tools=tools,
+        # Structured per-run logs (AGENT_LOG_LEVEL) replace printing every scratchpad to stdout.
+        verbose=False,
+        max_iterations=int(os.getenv("AGENT_MAX_ITERATIONS", 15)),
+        max_execution_time=float(os.getenv("AGENT_MAX_EXECUTION_TIME", 180)),
+        max_parallel_tools=int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", 4)),
+        default_tool_timeout=float(os.getenv("AGENT_TOOL_TIMEOUT", 60)),
+        tool_timeouts={
+            "GoogleSearchTool": float(os.getenv("GOOGLE_SEARCH_TOOL_TIMEOUT", 20)),
+            "GitHubCodeUrlSearchTool": float(os.getenv("GITHUB_SEARCH_TOOL_TIMEOUT", 20)),
+            "GetContentFromUrlTool": float(os.getenv("GET_CONTENT_TOOL_TIMEOUT", 45)),
+        }
+    )
+
+
+def _build_history_compactor():
+    return HistoryCompactor(
+        max_tokens=int(os.getenv("HISTORY_TOKEN_BUDGET", 30000)),
+        keep_last_turns=int(os.getenv("HISTORY_KEEP_TURNS", 6)),
+        summarizer=chat_enhancer.conversation_summary,
+        asummarizer=chat_enhancer.aconversation_summary
+    )
+
+
+def _build_response_cache():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    return SemanticResponseCache(
+        embedder=GoogleGenerativeAIEmbeddings(model=os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "models/text-embedding-004")),
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92)),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", 24 * 3600)),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 500)),
+        max_history_turns=int(os.getenv("SEMANTIC_CACHE_MAX_HISTORY", 0))
+    )
 
-agent = create_tool_calling_agent(
-    llm=llm,
-    prompt=prompt, 
-    tools=tools
-)
 
-agent_e = AgentExecutor(
-    agent=agent,
-    tools=tools,
-    verbose=True
+configure_logging()
+
+# Shared and stateless between calls, everything that belongs to one call lives in its AgentRunContext.
+agent_e = LazyObject(_build_agent_executor)
+
+# Shared with app.py, so the prompt enhancer and the history compactor use one summary cache.
+chat_enhancer = LazyObject(ChatEnhancer)
+
+history_compactor = LazyObject(_build_history_compactor)
+
+# Opt-in with SEMANTIC_CACHE=1: first-turn prompts similar to an earlier one get its response without running the agent.
+response_cache = LazyObject(_build_response_cache) if os.getenv("SEMANTIC_CACHE", "0") == "1" else None
+
+# Reported on /metrics once built, collecting never builds them.
+metrics.register("gemini", lambda: chat_enhancer.stats()["calls"] if chat_enhancer.lazy_initialized else None, label="model")
+metrics.register("summary_cache", lambda: chat_enhancer.summary_cache.stats() if chat_enhancer.lazy_initialized else None)
+metrics.register("history_compactor", lambda: history_compactor.stats() if history_compactor.lazy_initialized else None)
+metrics.register(
+    "semantic_cache",
+    lambda: response_cache.stats() if response_cache is not None and response_cache.lazy_initialized else None
 )
 
-def DotCoderAgent(query, chat_history, system_prompt=system_prompt):
-    response = agent_e.invoke({"query": query, "chat_history": chat_history, "system_prompt": system_prompt})
-    return response
 
+def __getattr__(name):
+    # `system_prompt` used to be a module attribute read at import time.
+    if name == "system_prompt":
+        return get_system_prompt()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _uses_response_cache(query, chat_history, system_prompt) -> bool:
+    return (
+        response_cache is not None
+        and (system_prompt is None or system_prompt == get_system_prompt())
+        and response_cache.eligible(query, chat_history)
+    )
+
+
+def _store_response(probe, output):
+    if probe is not None and isinstance(output, str):
+        response_cache.store(probe, output)
+
+
+def DotCoderAgent(query, chat_history, system_prompt=None, request_id=None):
+    """Run the agent, the response has `from_cache` set when it was served by the semantic response cache."""
+    with AgentRunContext(request_id) as context:
+        probe = None
+        if _uses_response_cache(query, chat_history, system_prompt):
+            cached, probe = response_cache.lookup(query, chat_history)
+            if cached is not None:
+                context.finish(from_cache=True)
+                return {"output": cached, "from_cache": True}
+
+        system_prompt = system_prompt or get_system_prompt()
+        chat_history = history_compactor.compact(chat_history)
+        response = agent_e.invoke(
+            {"query": query, "chat_history": chat_history, "system_prompt": system_prompt},
+            config=context.config()
+        )
+        _store_response(probe, response.get("output"))
+        context.finish()
+        return response
+
+
+async def DotCoderAgentAsync(query, chat_history, system_prompt=None, request_id=None):
+    """Async version of `DotCoderAgent`, LLM and tool calls run on the event loop instead of a worker thread."""
+    with AgentRunContext(request_id) as context:
+        probe = None
+        if _uses_response_cache(query, chat_history, system_prompt):
+            cached, probe = await response_cache.alookup(query, chat_history)
+            if cached is not None:
+                context.finish(from_cache=True)
+                return {"output": cached, "from_cache": True}
+
+        system_prompt = system_prompt or get_system_prompt()
+        chat_history = await history_compactor.acompact(chat_history)
+        response = await agent_e.ainvoke(
+            {"query": query, "chat_history": chat_history, "system_prompt": system_prompt},
+            config=context.config()
+        )
+        _store_response(probe, response.get("output"))
+        context.finish()
+        return response
+
+
+@functools.lru_cache(maxsize=None)
+def _stream_event_handler_class():
+    # Defined on first use, so langchain_core's callbacks are not imported with this module.
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class _StreamEventHandler(BaseCallbackHandler):
+        """Forward LLM tokens and tool progress of one agent run into a queue."""
+
+        def __init__(self, queue):
+            self.queue = queue
+
+        def on_llm_new_token(self, token, **kwargs):
+            if token:
+                self.queue.put(("token", token))
+
+        def on_tool_start(self, serialized, input_str, **kwargs):
+            self.queue.put(("tool_start", {"tool": (serialized or {}).get("name"), "input": input_str}))
+
+        def on_tool_end(self, output, **kwargs):
+            self.queue.put(("tool_end", {"tool": kwargs.get("name")}))
+
+        def on_tool_error(self, error, **kwargs):
+            # The error itself is logged by the run context, the browser only learns which tool failed.
+            self.queue.put(("tool_error", {"tool": kwargs.get("name")}))
+
+    return _StreamEventHandler
+
+
+# Sent to the browser instead of the exception, which is logged with its traceback.
+STREAM_ERROR_MESSAGE = "The assistant could not answer this message. Please try again."
+
+
+def DotCoderAgentStream(query, chat_history, system_prompt=None, request_id=None):
+    """
+        Run the agent and yield `(event, data)` tuples as they are produced.
+
+        Events are `token`, `tool_start`, `tool_end`, `tool_error`, then either `final` with the
+        complete output or `error` with a generic message for the user. A response served by the semantic
+        response cache is `from_cache` followed directly by `final`.
+    """
+    queue = Queue()
+    done = object()
+
+    # The run happens on its own thread, which owns the run context for the whole call and
+    # continues the caller's trace.
+    def run():
+        try:
+            with AgentRunContext(request_id) as context:
+                probe = None
+                if _uses_response_cache(query, chat_history, system_prompt):
+                    cached, probe = response_cache.lookup(query, chat_history)
+                    if cached is not None:
+                        context.finish(from_cache=True)
+                        queue.put(("from_cache", True))
+                        queue.put(("final", cached))
+                        return
+
+                compacted_history = history_compactor.compact(chat_history)
+                response = agent_e.invoke(
+                    {"query": query, "chat_history": compacted_history, "system_prompt": system_prompt or get_system_prompt()},
+                    config=context.config([_stream_event_handler_class()(queue)])
+                )
+                _store_response(probe, response["output"])
+                context.finish()
+                queue.put(("final", response["output"]))
+        except Exception:
+            logger.exception("Agent stream failed")
+            queue.put(("error", STREAM_ERROR_MESSAGE))
+        finally:
+            queue.put(done)
+
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+
+    while True:
+        item = queue.get()
+        if item is done:
+            break
+        yield item
+
+
+async def DotCoderAgentAsyncStream(query, chat_history, system_prompt=None, request_id=None):
+    """Async version of `DotCoderAgentStream`, yields the same `(event, data)` tuples."""
+    try:
+        with AgentRunContext(request_id) as context:
+            probe = None
+            if _uses_response_cache(query, chat_history, system_prompt):
+                cached, probe = await response_cache.alookup(query, chat_history)
+                if cached is not None:
+                    context.finish(from_cache=True)
+                    yield ("from_cache", True)
+                    yield ("final", cached)
+                    return
 
+            system_prompt = system_prompt or get_system_prompt()
+            chat_history = await history_compactor.acompact(chat_history)
+            async for event in agent_e.astream_events(
+                {"query": query, "chat_history": chat_history, "system_prompt": system_prompt},
+                config=context.config(),
+                version="v2"
+            ):
+                kind = event["event"]
+                if kind == "on_chat_model_stream":
+                    token = event["data"]["chunk"].content
+                    if token and isinstance(token, str):
+                        yield ("token", token)
+                elif kind == "on_tool_start":
+                    yield ("tool_start", {"tool": event["name"], "input": str(event["data"].get("input"))})
+                elif kind == "on_tool_end":
+                    yield ("tool_end", {"tool": event["name"]})
+                elif kind == "on_chain_end" and event["name"] == context.name:
+                    _store_response(probe, event["data"]["output"]["output"])
+                    context.finish()
+                    yield ("final", event["data"]["output"]["output"])
+    except Exception:
+        logger.exception("Agent stream failed")
+        yield ("error", STREAM_ERROR_MESSAGE)
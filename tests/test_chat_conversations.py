@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+import app as app_module
+from dotcoder.conversation_store import InMemoryConversationStore
+
+
+class Auth:
+    def account_info(self, token):
+        return {"users": [{"localId": "owner"}]}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    store = InMemoryConversationStore()
+    runs = []
+
+    def agent(query, chat_history, request_id=None):
+        runs.append(chat_history)
+        return {"output": f"answer to {query}"}
+
+    monkeypatch.setattr(app_module, "conversation_store", store)
+    monkeypatch.setattr(app_module, "auth", Auth())
+    monkeypatch.setattr(app_module, "get_valid_token", lambda: "token")
+    monkeypatch.setattr(app_module, "DotCoderAgent", agent)
+    client = app_module.app.test_client()
+    client.store, client.runs = store, runs
+    return client
+
+
+def test_first_message_starts_a_conversation(client):
+    response = client.post("/api/chat-data", data={"query": "hi", "conversation_id": ""})
+    conversation_id = response.json["conversation_id"]
+    assert client.store.load("owner", conversation_id) == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "answer to hi"},
+    ]
+
+    client.post("/api/chat-data", data={"query": "more", "conversation_id": conversation_id})
+    assert client.runs[-1] == [("user", "hi"), ("assistant", "answer to hi")]
+
+
+@pytest.mark.parametrize("endpoint", ["/api/chat-data", "/api/chat-data/stream"])
+def test_unknown_conversation_is_a_conflict(client, endpoint):
+    response = client.post(endpoint, data={"query": "hi", "conversation_id": "evicted"})
+    assert response.status_code == 409
+    assert client.runs == []
+
+
+def test_resent_history_restores_the_conversation(client):
+    history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}, {"role": 1, "content": "dropped"}]
+    response = client.post("/api/chat-data", data={"query": "more", "conversation_id": "evicted", "history": json.dumps(history)})
+
+    assert response.status_code == 200
+    assert response.json["conversation_id"] == "evicted"
+    assert client.runs[-1] == [("user", "hi"), ("assistant", "hello")]
+    assert len(client.store.load("owner", "evicted")) == 4
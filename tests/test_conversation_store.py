@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from dotcoder.conversation_store import ConversationStore, InMemoryConversationStore, SQLiteConversationStore
+
+TURN = [{"role": "user", "content": "hi"}]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryConversationStore()
+    return SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"))
+
+
+def test_unknown_conversation_is_none(store):
+    assert store.load("owner", "missing") is None
+
+
+def test_turns_are_appended_in_order(store):
+    store.append("owner", "c", TURN)
+    store.append("owner", "c", [{"role": "assistant", "content": "hello"}])
+    assert store.load("owner", "c") == TURN + [{"role": "assistant", "content": "hello"}]
+
+
+def test_conversations_are_namespaced_by_owner(store):
+    store.append("owner", "c", TURN)
+    assert store.load("other", "c") is None
+
+
+def test_backend_must_implement_every_method():
+    class LoadOnly(ConversationStore):
+        def load(self, owner, conversation_id, token=None):
+            return None
+
+    with pytest.raises(TypeError):
+        LoadOnly()
+
+
+def test_memory_store_keeps_the_most_recent_conversations():
+    store = InMemoryConversationStore(max_conversations=2)
+    for conversation_id in ("a", "b", "c"):
+        store.append("owner", conversation_id, TURN)
+    assert store.load("owner", "a") is None
+    assert store.load("owner", "c") == TURN
+
+
+def test_sqlite_store_keeps_the_most_recent_conversations(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"), max_conversations=2)
+    for conversation_id in ("a", "b", "c"):
+        store.append("owner", conversation_id, TURN)
+        time.sleep(0.01)
+    assert store.load("owner", "a") is None
+    assert store.load("owner", "b") == TURN
+    assert store.load("owner", "c") == TURN
+
+
+def test_sqlite_store_drops_idle_conversations(tmp_path):
+    store = SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"), max_age=0.05)
+    store.append("owner", "old", TURN)
+    time.sleep(0.1)
+    store.append("owner", "new", TURN)
+    assert store.load("owner", "old") is None
+    assert store.load("owner", "new") == TURN
@@ -0,0 +1,73 @@
+import time
+import threading
+
+from dotcoder.gallery_cache import GalleryCache
+
+
+def make_loader(snapshots):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return snapshots[min(len(calls), len(snapshots)) - 1]
+
+    return loader, calls
+
+
+def test_snapshot_is_served_within_the_ttl():
+    cache = GalleryCache(ttl=30)
+    loader, calls = make_loader([{"a": {"timestamp": "1"}}])
+    assert cache.get_all(loader) == {"a": {"timestamp": "1"}}
+    assert cache.get_all(loader) == {"a": {"timestamp": "1"}}
+    assert len(calls) == 1
+
+
+def test_stale_snapshot_is_refreshed_in_the_background():
+    cache = GalleryCache(ttl=0.01, stale_ttl=30)
+    release = threading.Event()
+    snapshots = iter([{"a": {"timestamp": "1"}}, {"b": {"timestamp": "2"}}])
+
+    def loader():
+        snapshot = next(snapshots)
+        if "b" in snapshot:
+            release.wait(5)
+        return snapshot
+
+    cache.get_all(loader)
+    time.sleep(0.05)
+
+    # The stale snapshot is served while the refresh is still running.
+    assert cache.get_all(loader) == {"a": {"timestamp": "1"}}
+    release.set()
+    for _ in range(100):
+        if cache.stats()["loads"] == 2:
+            break
+        time.sleep(0.01)
+    assert cache.stats()["loads"] == 2
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_invalidate_reloads_on_the_next_view():
+    cache = GalleryCache(ttl=30)
+    loader, calls = make_loader([{"a": {"timestamp": "1"}}, {"b": {"timestamp": "2"}}])
+    cache.get_all(loader)
+    cache.invalidate()
+    assert cache.get_all(loader) == {"b": {"timestamp": "2"}}
+
+
+def test_upsert_and_remove_keep_pages_ordered():
+    cache = GalleryCache(ttl=30)
+    loader, _ = make_loader([{"a": {"timestamp": "1"}, "b": {"timestamp": "2"}}])
+    cache.get_all(loader)
+
+    cache.upsert("c", {"timestamp": "3"})
+    cache.upsert("a", {"timestamp": "4"})
+    cache.remove("b")
+    projects, has_more = cache.page(loader, page_size=10)
+    assert [project["key"] for project in projects] == ["a", "c"]
+    assert not has_more
+
+
+def test_failed_load_is_reported():
+    cache = GalleryCache()
+    assert cache.get_all(lambda: None) is None
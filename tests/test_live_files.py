@@ -0,0 +1,69 @@
+import gzip
+
+import pytest
+
+from dotcoder import live_files
+from dotcoder.live_files import LiveFileCache
+
+
+def entry(size: int) -> dict:
+    return {"etag": "e", "variants": {None: b"x" * size}, "checked_at": 0}
+
+
+def test_cache_stays_within_its_byte_budget():
+    cache = LiveFileCache(max_bytes=100)
+    cache.put("a", entry(40))
+    cache.put("b", entry(40))
+    cache.get("a")
+    cache.put("c", entry(40))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["bytes"] == 80
+
+
+def test_entry_larger_than_the_budget_is_not_cached():
+    cache = LiveFileCache(max_bytes=100)
+    cache.put("a", entry(200))
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_hot_projects_count_views_and_hits():
+    cache = LiveFileCache()
+    cache.record_view("u/a", hit=False)
+    cache.record_view("u/a", hit=True)
+    cache.record_view("u/b", hit=False)
+    assert cache.hot_projects(top=1) == {"u/a": {"views": 2, "hits": 1}}
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(live_files, "live_file_cache", LiveFileCache())
+    return str(tmp_path)
+
+
+def test_republish_invalidates_the_cached_file(directory):
+    live_files.write_live_project("user", "page", "<p>one</p>", directory)
+    assert live_files.get_live_project("user/page", directory)["variants"][None] == b"<p>one</p>"
+
+    live_files.write_live_project("user", "page", "<p>two</p>", directory)
+    loaded = live_files.get_live_project("user/page", directory)
+    assert loaded["variants"][None] == b"<p>two</p>"
+    assert loaded["etag"] == live_files.project_version("<p>two</p>")
+
+
+def test_variant_from_another_publish_is_not_served(directory):
+    html_path = live_files.write_live_project("user", "page", "<p>old</p>", directory)
+    # A reader landing between the new .gz and the new body.
+    with open(f"{html_path}.gz", "wb") as file:
+        file.write(gzip.compress(b"<p>new</p>"))
+
+    loaded = live_files.load_live_project("user/page", directory)
+    assert loaded["etag"] == live_files.project_version("<p>old</p>")
+    assert "gzip" not in loaded["variants"]
+
+
+def test_versioned_url():
+    assert live_files.versioned_url({"url": "/live/u/p", "version": "abc"}) == "/live/u/p?v=abc"
+    assert live_files.versioned_url({"url": "/live/u/p"}) == "/live/u/p"
@@ -0,0 +1,51 @@
+import time
+import asyncio
+
+from langchain_core.tools import Tool
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.runnables import RunnableLambda
+
+from dotcoder.parallel_agent import ParallelAgentExecutor
+
+
+def sleeping_tool(name: str, seconds: float) -> Tool:
+    async def arun(query):
+        await asyncio.sleep(seconds)
+        return f"{name} {query}"
+
+    return Tool(name=name, func=lambda query: (time.sleep(seconds), f"{name} {query}")[1], coroutine=arun, description=name)
+
+
+def plan(inputs):
+    # One step calling every tool, then an answer listing the observations in order.
+    if inputs["intermediate_steps"]:
+        return AgentFinish({"output": [observation for _, observation in inputs["intermediate_steps"]]}, "")
+    return [AgentAction("slow", "a", ""), AgentAction("fast", "b", ""), AgentAction("fast", "c", "")]
+
+
+def build_executor(**kwargs) -> ParallelAgentExecutor:
+    tools = [sleeping_tool("slow", 1.0), sleeping_tool("fast", 0.2)]
+    return ParallelAgentExecutor(agent=RunnableLambda(plan), tools=tools, **kwargs)
+
+
+EXPECTED = ["slow timed out after 0.4 seconds.", "fast b", "fast c"]
+
+
+def test_step_runs_concurrently_and_times_out_per_tool():
+    executor = build_executor(tool_timeouts={"slow": 0.4})
+    started = time.monotonic()
+    assert executor.invoke({"input": "q"})["output"] == EXPECTED
+    assert time.monotonic() - started < 0.8
+
+
+def test_async_step_runs_concurrently_and_times_out_per_tool():
+    executor = build_executor(tool_timeouts={"slow": 0.4})
+    started = time.monotonic()
+    assert asyncio.run(executor.ainvoke({"input": "q"}))["output"] == EXPECTED
+    assert time.monotonic() - started < 0.8
+
+
+def test_timeout_starts_when_the_tool_gets_a_slot():
+    executor = build_executor(tool_timeouts={"slow": 0.4}, default_tool_timeout=0.3, max_parallel_tools=1)
+    # The fast calls wait behind the slow one, but only their own 0.2 s counts against their timeout.
+    assert executor.invoke({"input": "q"})["output"] == EXPECTED
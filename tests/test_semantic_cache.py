@@ -0,0 +1,45 @@
+import time
+
+from dotcoder.semantic_cache import SemanticResponseCache
+
+
+class Embedder:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+
+def test_normalized_prompts_match_exactly():
+    cache = SemanticResponseCache()
+    _, probe = cache.lookup("Build a landing page!")
+    cache.store(probe, "response")
+    assert cache.lookup("  build a LANDING page ")[0] == "response"
+
+
+def test_similar_prompts_match_above_the_threshold():
+    cache = SemanticResponseCache(Embedder({
+        "landing page": [1.0, 0.0],
+        "a landing page": [0.99, 0.1],
+        "a pricing table": [0.5, 0.86],
+    }), threshold=0.9)
+    _, probe = cache.lookup("landing page")
+    cache.store(probe, "response")
+
+    assert cache.lookup("a landing page")[0] == "response"
+    assert cache.lookup("a pricing table")[0] is None
+
+
+def test_responses_expire():
+    cache = SemanticResponseCache(ttl=0.05)
+    _, probe = cache.lookup("prompt")
+    cache.store(probe, "response")
+    time.sleep(0.1)
+    assert cache.lookup("prompt")[0] is None
+
+
+def test_only_short_histories_are_eligible():
+    cache = SemanticResponseCache(max_history_turns=0)
+    assert cache.eligible("prompt", [])
+    assert not cache.eligible("prompt", [("user", "earlier")])
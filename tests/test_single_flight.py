@@ -0,0 +1,44 @@
+import time
+import threading
+
+from dotcoder.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight(result_ttl=0)
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", slow))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["result"] * 5
+
+
+def test_result_is_reused_until_it_expires():
+    flight = SingleFlight(result_ttl=0.05)
+    calls = []
+
+    def func():
+        calls.append(1)
+        return len(calls)
+
+    assert flight.do("key", func) == 1
+    assert flight.do("key", func) == 1
+    time.sleep(0.1)
+    assert flight.do("key", func) == 2
+
+
+def test_failed_call_is_not_remembered():
+    flight = SingleFlight(result_ttl=30)
+    assert flight.do("key", lambda: None) is None
+    assert flight.do("key", lambda: "retried") == "retried"
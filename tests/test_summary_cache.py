@@ -0,0 +1,29 @@
+from dotcoder.summary_cache import SummaryCache
+
+
+def turns(*contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": content} for i, content in enumerate(contents)]
+
+
+def test_prefix_keys_chain_earlier_turns():
+    keys = SummaryCache.prefix_keys(turns("a", "b"))
+    assert keys[0] == SummaryCache.prefix_keys(turns("a"))[0]
+    assert keys[1] != SummaryCache.prefix_keys(turns("x", "b"))[1]
+
+
+def test_lookup_finds_the_longest_summarized_prefix():
+    cache = SummaryCache()
+    cache.set(turns("a", "b"), "summary of two")
+
+    assert cache.lookup(turns("a", "b")) == (2, "summary of two")
+    assert cache.lookup(turns("a", "b", "c")) == (2, "summary of two")
+    assert cache.lookup(turns("x", "b")) == (0, None)
+    assert cache.stats()["partial_hits"] == 1
+
+
+def test_least_recently_used_summary_is_evicted():
+    cache = SummaryCache(max_entries=1)
+    cache.set(turns("a"), "first")
+    cache.set(turns("b"), "second")
+    assert cache.lookup(turns("a")) == (0, None)
+    assert cache.lookup(turns("b")) == (1, "second")
@@ -0,0 +1,53 @@
+import json
+import time
+import base64
+
+from dotcoder.token_cache import TokenCache
+
+
+def make_token(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def test_entry_expires_with_the_token():
+    cache = TokenCache(ttl=300)
+    token = make_token(time.time() + 0.05)
+    cache.set(token, {"users": [1]})
+    assert cache.get(token) == {"users": [1]}
+
+    time.sleep(0.1)
+    assert cache.get(token) is None
+
+
+def test_expired_token_is_not_stored():
+    cache = TokenCache(ttl=300)
+    token = make_token(time.time() - 1)
+    cache.set(token, {"users": [1]})
+    assert cache.stats()["size"] == 0
+
+
+def test_ttl_caps_long_lived_tokens():
+    cache = TokenCache(ttl=0.05)
+    token = make_token(time.time() + 3600)
+    cache.set(token, {"users": [1]})
+    time.sleep(0.1)
+    assert cache.get(token) is None
+
+
+def test_least_recently_used_token_is_evicted():
+    cache = TokenCache(max_size=2)
+    cache.set("a", {"a": 1})
+    cache.set("b", {"b": 1})
+    cache.get("a")
+    cache.set("c", {"c": 1})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"a": 1}
+    assert cache.get("c") == {"c": 1}
+
+
+def test_invalidate_drops_the_token():
+    cache = TokenCache()
+    cache.set("a", {"a": 1})
+    cache.invalidate("a")
+    assert cache.get("a") is None
@@ -0,0 +1,97 @@
+import os
+import time
+
+import pytest
+
+from dotcoder import http_client
+from dotcoder.github_tool import GitHubTool
+from dotcoder.url_content_cache import UrlContentCache
+
+
+def test_conditional_headers_need_a_cached_body(tmp_path):
+    cache = UrlContentCache(str(tmp_path))
+    assert cache.conditional_headers("https://x/a") == {}
+
+    cache.set("https://x/a", "body", etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    assert cache.conditional_headers("https://x/a") == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert cache.get("https://x/a") == "body"
+
+
+def test_content_without_validators_is_not_cached(tmp_path):
+    cache = UrlContentCache(str(tmp_path))
+    cache.set("https://x/a", "body")
+    assert cache.conditional_headers("https://x/a") == {}
+    assert cache.get("https://x/a") is None
+
+
+def test_least_recently_used_bodies_are_evicted_over_the_budget(tmp_path):
+    cache = UrlContentCache(str(tmp_path), max_bytes=250)
+    for i in range(5):
+        cache.set(f"https://x/{i}", str(i) * 100, etag=str(i))
+        time.sleep(0.01)
+
+    assert cache.stats()["bytes"] <= 250
+    assert cache.get("https://x/0") is None
+    assert cache.get("https://x/4") == "4" * 100
+    assert len(os.listdir(cache.blob_directory)) == cache.stats()["unique_contents"]
+
+
+def test_unused_entries_expire(tmp_path):
+    cache = UrlContentCache(str(tmp_path), max_age=0.05)
+    cache.set("https://x/old", "old", etag="1")
+    time.sleep(0.1)
+    cache.set("https://x/new", "new", etag="2")
+    assert cache.get("https://x/old") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_replaced_body_is_deleted(tmp_path):
+    cache = UrlContentCache(str(tmp_path))
+    cache.set("https://x/a", "one", etag="1")
+    cache.set("https://x/a", "two", etag="2")
+    assert len(os.listdir(cache.blob_directory)) == 1
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.text = body.decode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def tool(tmp_path):
+    return GitHubTool(github_token="token", content_cache=UrlContentCache(str(tmp_path)))
+
+
+def test_not_modified_response_is_served_from_the_cache(tool, monkeypatch):
+    session = FakeSession([FakeResponse(200, b"<html/>", {"ETag": '"v1"'}), FakeResponse(304)])
+    monkeypatch.setattr(http_client, "get_session", lambda: session)
+
+    assert tool.get_content_from_url("https://raw/x") == "<html/>"
+    assert tool.get_content_from_url("https://raw/x") == "<html/>"
+    assert session.requests == [{}, {"If-None-Match": '"v1"'}]
+    assert tool.content_cache.stats()["revalidated"] == 1